@@ -1,927 +1,2842 @@
-import asyncio
-import websockets
-import numpy as np
-import torch
-import cv2
-import time
-import os
-import uuid
-import requests
-import json
-from datetime import datetime
-import threading
-import aiohttp
-
-API_URL = "http://127.0.0.1:5001/api/"
-model = torch.hub.load("yolov5", "custom", path="best.pt", source="local")
-model.conf = 0.4  # Set confidence threshold
-model.iou = 0.5   # Set IoU threshold for NMS
-
-STAGING_AREA_BOUNDS = [
-    (160, 240),  # Top-left  Door Side Line
-    (344, 110),  # Top-right Door Side Line
-    (580, 260),  # Bottom-right In/Out Side Line
-    (458, 638)   # Bottom-left In/Out Side Line
-]
-STAGING_AREA_TEXT_POS = (
-    int((STAGING_AREA_BOUNDS[1][0] + STAGING_AREA_BOUNDS[2][0]) / 2 + 10),
-    int((STAGING_AREA_BOUNDS[1][1] + STAGING_AREA_BOUNDS[2][1]) / 2 )
-)
-DOOR_STATUS = ""
-PALLET_STATUS = "Init"
-COLOR_RED = (0, 0, 255)
-COLOR_GREEN = (0, 255, 0)
-COLOR_BLUE = (0, 0, 255)
-COLOR_BLACK = (0, 0, 0)
-COLOR_PALLET = (200, 0, 0)
-G_FONT = cv2.FONT_HERSHEY_SIMPLEX
-LINE_WIDTH = 1
-G_FONT_SCALE = 0.5
-def sendPostData(doc_cat, doc_type, pallet_id, door_id, comments):
-    global API_URL
-    if pallet_id is not None and isinstance(pallet_id, uuid.UUID):
-        pallet_id = str(pallet_id)
-
-    #Read from customizing.....??? replace with camera IP
-    payload = {
-        "WHNUM": "WH001",
-        "CameraNO": "Camera01",
-        "DocCat": doc_cat,       
-        "DocType": doc_type,
-        "PAK_ID": pallet_id,
-        "DoorNO": door_id
-    }
-    
-    # Create a function to handle the API request asynchronously
-    async def send_request_async():
-        try:
-            url = f"{API_URL.rstrip('/')}/{doc_cat}"
-            print(f"Sending async request to {url} with payload: {payload}")
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=payload, timeout=10) as response:
-                    # Check if the request was successful
-                    if response.status >= 400:
-                        error_text = await response.text()
-                        print(f"❌ HTTP Error {response.status}: {error_text}")
-                        return {"error": f"HTTP Error {response.status}", "details": error_text}
-                    
-                    # Return the JSON response
-                    result = await response.json()
-                    print(f"✅ {comments} API Response: {result}")
-                    return result
-        except aiohttp.ClientConnectorError:
-            print(f"❌ Connection Error: Could not connect to {url}")
-            return {"error": "Connection Error"}
-        except asyncio.TimeoutError:
-            print(f"❌ Timeout Error: Request to {url} timed out")
-            return {"error": "Timeout Error"}
-        except Exception as e:
-            print(f"❌ API Request Failed: {e}")
-            return {"error": str(e)}
-    
-    # Create a function to run the async task in a separate thread
-    def run_async_in_thread():
-        # Create a new event loop for the thread
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            # Run the async function in the new loop
-            result = loop.run_until_complete(send_request_async())
-            return result
-        finally:
-            loop.close()
-    
-    # Start a new thread to handle the API request
-    thread = threading.Thread(target=run_async_in_thread)
-    thread.daemon = True  # Set as daemon so it doesn't block program exit
-    thread.start()
-def ValidateyStagingArea():
-    if (STAGING_AREA_BOUNDS[0][0] > STAGING_AREA_BOUNDS[1][0]):
-        return False
-    if (STAGING_AREA_BOUNDS[3][0] > STAGING_AREA_BOUNDS[2][0]):
-        return False
-    return True
-
-def drawStagingArea(frame):
-    # Draw the quadrilateral
-    # for i in range(len(STAGING_AREA_BOUNDS)):
-    #     pt1 = STAGING_AREA_BOUNDS[i]
-    #     pt2 = STAGING_AREA_BOUNDS[(i + 1) % len(STAGING_AREA_BOUNDS)]
-    #     cv2.line(frame, pt1, pt2, (0, 0, 255), 1)
-    points = np.array(STAGING_AREA_BOUNDS, dtype=np.int32)
-    cv2.polylines(frame, [points], isClosed=True, color=COLOR_RED, thickness=LINE_WIDTH)
-    
-    # Add label for the quadrilateral area
-    cv2.putText(frame, "STAGING AREA", STAGING_AREA_TEXT_POS,
-                G_FONT, G_FONT_SCALE, COLOR_RED, LINE_WIDTH)
-                
-    cv2.putText(frame, DOOR_STATUS, (10, 30),
-                G_FONT, G_FONT_SCALE, COLOR_GREEN, LINE_WIDTH)
-
-    cv2.putText(frame, PALLET_STATUS, (10, 50),
-                G_FONT, G_FONT_SCALE, COLOR_GREEN, LINE_WIDTH)
-
-def showFrame(frame):    
-    cv2.imshow('Received Frame', frame)
-
-def is_point_inside_polygon(point, polygon):
-    x, y = point
-    n = len(polygon)
-    inside = False
-    
-    p1x, p1y = polygon[0]
-    for i in range(1, n + 1):
-        p2x, p2y = polygon[i % n]
-        if y > min(p1y, p2y):
-            if y <= max(p1y, p2y):
-                if x <= max(p1x, p2x):
-                    if p1y != p2y:
-                        xinters = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
-                    if p1x == p2x or x <= xinters:
-                        inside = not inside
-        p1x, p1y = p2x, p2y
-    
-    return inside
-
-def calculate_distance_to_line(point, line_point1, line_point2):
-    x, y = point
-    x1, y1 = line_point1
-    x2, y2 = line_point2
-        
-    A = y2 - y1
-    B = x1 - x2
-    C = x2*y1 - x1*y2
-    
-    distance = abs(A*x + B*y + C) / ((A**2 + B**2)**0.5)
-    return distance
-def distance_to_points(point1, point2):
-    x1, y1 = point1
-    x2, y2 = point2
-    return ((x1 - x2) ** 2 + (y1 - y2) ** 2) ** 0.5
-def transform_to_position_coordinates(point, origin, x_axis_point):    
-    # Calculate the unit vector along the door side line (new x-axis)
-    dx = x_axis_point[0] - origin[0]
-    dy = x_axis_point[1] - origin[1]
-    door_line_length = (dx**2 + dy**2)**0.5
-    x_unit_vector = (dx / door_line_length, dy / door_line_length)
-    
-    # Calculate the unit vector perpendicular to the door side line (new y-axis)
-    # Rotate 90 degrees counterclockwise
-    y_unit_vector = (-x_unit_vector[1], x_unit_vector[0])
-    
-    # Translate point relative to the new origin
-    translated_x = point[0] - origin[0]
-    translated_y = point[1] - origin[1]
-    
-    # Project onto the new axes
-    new_x = translated_x * x_unit_vector[0] + translated_y * x_unit_vector[1]
-    new_y = translated_x * y_unit_vector[0] + translated_y * y_unit_vector[1]
-    
-    return (new_x, new_y)
-def getWidthHeight(x1, y1, x2, y2):
-    width = x2 - x1
-    height = y2 - y1
-    return (width, height)
-def getCenterPos(x1, y1, x2, y2):
-    center_x = (x1 + x2) // 2
-    center_y = (y1 + y2) // 2
-    return (center_x, center_y)
-objectDoors = [] # x1, y1, x2, y2, conf, width, heigh, x0, y0. status, validCounts, isValidated, updateTime, isUpdated
-def validateDoors():
-    global DOOR_STATUS
-    #print(f"door status: {DOOR_STATUS}")
-    # if isValidated is false and updateTime is over 3 seconds, remove these doors from objectDoors
-    current_time = time.time()
-    i = 0
-    while i < len(objectDoors):
-        if not objectDoors[i]["isValidated"] and current_time - objectDoors[i]["updateTime"] > 3:
-            objectDoors.pop(i)
-        else:
-            if objectDoors[i]["validCounts"] > 2:
-                objectDoors[i]["validCounts"] = 2
-                objectDoors[i]["isValidated"] = True
-                if objectDoors[i]["isUpdated"] == False:
-                    door_status = "Open" if objectDoors[i]["status"] else "Close"
-                    DOOR_STATUS =f"Door{i}: {door_status}"
-                    #print(f"---------{i}:{DOOR_STATUS}")
-                    sendPostData("Door", door_status, None, f"Door{i}", f"Door {door_status}")
-                    objectDoors[i]["isUpdated"] = True
-                    break
-            i += 1
-
-def updateDoorStatus(doors):
-    for door in doors:
-        w, h = getWidthHeight(door["x1"], door["y1"], door["x2"], door["y2"])
-        x0, y0 = getCenterPos(door["x1"], door["y1"], door["x2"], door["y2"])
-        x0, y0 = transform_to_position_coordinates((x0, y0), STAGING_AREA_BOUNDS[0], STAGING_AREA_BOUNDS[1])
-        min_distance = 100
-        id = -1
-        for i, objectDoor in enumerate(objectDoors):
-            if min_distance > abs(objectDoor["x0"] - x0):
-                min_distance = abs(objectDoor["x0"] - x0)
-                id = i
-        if id > -1 :
-            if min_distance < objectDoors[id]["width"]/2: # exist door
-                status = abs(y0) > h
-                if objectDoors[id]["status"] == status: # same status
-                    objectDoors[id]["x0"] = x0
-                    objectDoors[id]["y0"] = y0
-                    objectDoors[id]["validCounts"] += 1
-                    objectDoors[id]["updateTime"] = time.time()                    
-                else : # new status
-                    objectDoors[id]["x1"] = door["x1"]
-                    objectDoors[id]["y1"] = door["y1"]
-                    objectDoors[id]["x2"] = door["x2"]
-                    objectDoors[id]["y2"] = door["y2"]
-                    objectDoors[id]["conf"] = door["conf"]
-                    objectDoors[id]["width"] = w
-                    objectDoors[id]["height"] = h
-                    objectDoors[id]["x0"] = x0
-                    objectDoors[id]["y0"] = y0
-                    objectDoors[id]["status"] = status
-                    objectDoors[id]["validCounts"] = 0
-                    objectDoors[id]["updateTime"] = time.time()
-                    objectDoors[id]["isUpdated"] = not objectDoors[id]["isUpdated"]
-            else : # new door
-                status = abs(y0) > h
-                if x0 < objectDoors[id]["x0"]:
-                    id -= 1
-                objectDoors.insert(id, {"x1":door["x1"], "y1":door["y1"], "x2":door["x2"], "y2":door["y2"], "conf": door["conf"], "width":w, "height":h, "x0":x0, "y0":y0, "status":status, "validCounts": 0, "isValidated": False, "updateTime": time.time(), "isUpdated":True})
-        else: # empty door
-            status = abs(y0) > h
-            objectDoors.append({"x1":door["x1"], "y1":door["y1"], "x2":door["x2"], "y2":door["y2"], "conf": door["conf"], "width":w, "height":h, "x0":x0, "y0":y0, "status":status, "validCounts": 0, "isValidated": False, "updateTime": time.time(), "isUpdated":True})   
-
-def processDoors(doors):
-    updateDoorStatus(doors)
-    validateDoors()
-
-# Pallet tracking data structure
-objectPallets = [] # uuid, x1, y1, x2, y2, conf, width, height, x0, y0, is_inside, first_seen, last_seen, track_history
-
-fixedPallets = [] # uuid, x1, y1, x2, y2, conf, width, height, x0, y0, updateTime, track_history
-movingPallets = [] # uuid, x1, y1, x2, y2, conf, width, height, x0, y0, updateTime, track_history
-doorSidePallets = [] # uuid, x1, y1, x2, y2, conf, width, height, x0, y0, updateTime
-rackSidePallets = [] # uuid, x1, y1, x2, y2, conf, width, height, x0, y0, updateTime
-
-newMovingPallets = []
-newDoorSidePallets = []
-newRackSidePallets = []
-    
-def validatePallet(pallet):
-    current_time = time.time()
-    x1, y1, x2, y2 = pallet["x1"], pallet["y1"], pallet["x2"], pallet["y2"]
-    conf = pallet["conf"]
-    width, height = getWidthHeight(x1, y1, x2, y2)
-    x0, y0 = getCenterPos(x1, y1, x2, y2)
-    is_inside = is_point_inside_polygon((x0, y0), STAGING_AREA_BOUNDS)
-    xd, yd = transform_to_position_coordinates((x0, y0), STAGING_AREA_BOUNDS[0], STAGING_AREA_BOUNDS[1])
-    new_pallet = {
-        "uuid": None,
-        "x1": x1,
-        "y1": y1,
-        "x2": x2,
-        "y2": y2,
-        "conf": conf,
-        "width": width,
-        "height": height,
-        "x0": x0,
-        "y0": y0,
-        "xd": xd,
-        "yd": yd,
-        "updateTime": current_time
-    }
-    if is_inside:
-        matched = False
-        for newPallet in newMovingPallets:
-            # Check if pallet is fully contained in newPallet or vice versa
-            if ((pallet["x1"] >= newPallet["x1"] and pallet["y1"] >= newPallet["y1"] and 
-                 pallet["x2"] <= newPallet["x2"] and pallet["y2"] <= newPallet["y2"]) or 
-                (newPallet["x1"] >= pallet["x1"] and newPallet["y1"] >= pallet["y1"] and 
-                 newPallet["x2"] <= pallet["x2"] and newPallet["y2"] <= pallet["y2"])):
-                if newPallet["conf"] < pallet["conf"]:
-                    newPallet.update(new_pallet)
-                    # print(f"update newMovingPallets[{len(newMovingPallets)}] === {newPallet}")
-                matched = True
-                break
-        if not matched:
-            newMovingPallets.append(new_pallet)
-            # print(f"add newMovingPallets[{len(newMovingPallets)}] === {new_pallet}")
-    else:
-        xr, yr = transform_to_position_coordinates((x0, y0), STAGING_AREA_BOUNDS[1], STAGING_AREA_BOUNDS[2])
-        if abs(yr) > abs(yd):
-            matched = False
-            for newPallet in newDoorSidePallets:
-                # Check if pallet is fully contained in newPallet or vice versa
-                if ((pallet["x1"] >= newPallet["x1"] and pallet["y1"] >= newPallet["y1"] and 
-                     pallet["x2"] <= newPallet["x2"] and pallet["y2"] <= newPallet["y2"]) or 
-                    (newPallet["x1"] >= pallet["x1"] and newPallet["y1"] >= pallet["y1"] and 
-                     newPallet["x2"] <= pallet["x2"] and newPallet["y2"] <= pallet["y2"])):
-                    if newPallet["conf"] < pallet["conf"]:
-                        newPallet.update(new_pallet)
-                        # print(f"update newDoorSidePallets[{len(newDoorSidePallets)}] === {newPallet}")
-                    matched = True
-                    break
-            if not matched:
-                for i, objectDoor in enumerate(objectDoors):
-                    if objectDoor["status"] and objectDoor["x1"] < x0 and x0 < objectDoor["x2"]: # opened
-                        newDoorSidePallets.append(new_pallet)
-                        # print(f"add newDoorSidePallets[{len(newDoorSidePallets)}] === {new_pallet}")
-                        break
-        else:
-            matched = False
-            for newPallet in newRackSidePallets:
-                # Check if pallet is fully contained in newPallet or vice versa
-                if ((pallet["x1"] >= newPallet["x1"] and pallet["y1"] >= newPallet["y1"] and 
-                     pallet["x2"] <= newPallet["x2"] and pallet["y2"] <= newPallet["y2"]) or 
-                    (newPallet["x1"] >= pallet["x1"] and newPallet["y1"] >= pallet["y1"] and 
-                     newPallet["x2"] <= pallet["x2"] and newPallet["y2"] <= pallet["y2"])):
-                    if newPallet["conf"] < pallet["conf"]:
-                        newPallet.update(new_pallet)
-                        # print(f"update newRackSidePallets[{len(newRackSidePallets)}] === {newPallet}")
-                    matched = True
-                    break
-            if not matched:
-                newRackSidePallets.append(new_pallet)
-                # print(f"add newRackSidePallets[{len(newRackSidePallets)}] === {new_pallet}")
-
-def resetNewPallets():
-    global newMovingPallets, newDoorSidePallets, newRackSidePallets
-    newMovingPallets = []
-    newDoorSidePallets = []
-    newRackSidePallets = []
-def resetObjects():
-    global fixedPallets, movingPallets, doorSidePallets, rackSidePallets, objectDoors, DOOR_STATUS, PALLET_STATUS
-    fixedPallets = [] 
-    movingPallets = [] 
-    doorSidePallets = [] 
-    rackSidePallets = []
-    objectDoors = []
-    resetNewPallets()
-    DOOR_STATUS = "Init"
-    PALLET_STATUS = "Reset"
-
-def processPallets():
-    global PALLET_STATUS, newMovingPallets, newDoorSidePallets, newRackSidePallets
-    current_time = time.time()
-    
-    # Process door side pallets
-    i = 0
-    while i < len(doorSidePallets):
-        min_distance = 50
-        id  = -1
-        for j, pallet in enumerate(newDoorSidePallets):
-            distance = distance_to_points((pallet["x0"], pallet["y0"]), (doorSidePallets[i]["x0"], doorSidePallets[i]["y0"]))
-            if min_distance > distance:
-                min_distance = distance
-                id  = j        
-        if id > -1: # same door side state
-            pallet_obj = doorSidePallets[i]
-            pallet_obj["x1"] = newDoorSidePallets[id]["x1"]
-            pallet_obj["y1"] = newDoorSidePallets[id]["y1"]
-            pallet_obj["x2"] = newDoorSidePallets[id]["x2"]
-            pallet_obj["y2"] = newDoorSidePallets[id]["y2"]
-            pallet_obj["conf"] = newDoorSidePallets[id]["conf"]
-            pallet_obj["width"] = newDoorSidePallets[id]["width"]
-            pallet_obj["height"] = newDoorSidePallets[id]["height"]
-            pallet_obj["x0"] = newDoorSidePallets[id]["x0"]
-            pallet_obj["y0"] = newDoorSidePallets[id]["y0"]
-            pallet_obj["xd"] = newDoorSidePallets[id]["xd"]
-            pallet_obj["yd"] = newDoorSidePallets[id]["yd"]
-            pallet_obj["updateTime"] = newDoorSidePallets[id]["updateTime"]
-            newDoorSidePallets.pop(id)        
-            # print(f"update doorSidePallets[{len(doorSidePallets)}] === {pallet_obj}")    
-        else:            
-            for j, pallet in enumerate(newMovingPallets):
-                distance = distance_to_points((pallet["x0"], pallet["y0"]), (doorSidePallets[i]["x0"], doorSidePallets[i]["y0"]))
-                if min_distance > distance:
-                    min_distance = distance
-                    id  = j  
-            if id > -1 and doorSidePallets[i]["uuid"] is None: # unload state
-                p_uuid = uuid.uuid4()
-                sendPostData("Dock", "UOD", p_uuid, None, f"Dock Unload")
-                PALLET_STATUS = "unload state"
-                print(f"========={PALLET_STATUS}")
-                new_pallet = {
-                    "uuid": p_uuid,
-                    "x1": newMovingPallets[id]["x1"],
-                    "y1": newMovingPallets[id]["y1"],
-                    "x2": newMovingPallets[id]["x2"],
-                    "y2": newMovingPallets[id]["y2"],
-                    "conf": newMovingPallets[id]["conf"],
-                    "width": newMovingPallets[id]["width"],
-                    "height": newMovingPallets[id]["height"],
-                    "x0": newMovingPallets[id]["x0"],
-                    "y0": newMovingPallets[id]["y0"],
-                    "xd": newMovingPallets[id]["xd"],
-                    "yd": newMovingPallets[id]["yd"],
-                    "updateTime": newMovingPallets[id]["updateTime"],
-                    "track_history": [(doorSidePallets[i]["x0"], doorSidePallets[i]["y0"])]
-                }
-                # print(f"add movingPallets[{len(movingPallets)}] === {new_pallet}")
-                movingPallets.append(new_pallet)
-                doorSidePallets.pop(i)
-                newMovingPallets.pop(id)
-            elif current_time - doorSidePallets[i]["updateTime"] > 3: # if update time is over 3 seconds, deleted
-                doorSidePallets.pop(i)
-            else: # other state
-                i += 1
-    # Process rack side pallets
-    i = 0
-    while i < len(rackSidePallets):
-        min_distance = 50
-        id  = -1
-        for j, pallet in enumerate(newRackSidePallets):
-            distance = distance_to_points((pallet["x0"], pallet["y0"]), (rackSidePallets[i]["x0"], rackSidePallets[i]["y0"]))
-            if min_distance > distance:
-                min_distance = distance
-                id  = j        
-        if id > -1: # same rack side state
-            pallet_obj = rackSidePallets[i]
-            pallet_obj["x1"] = newRackSidePallets[id]["x1"]
-            pallet_obj["y1"] = newRackSidePallets[id]["y1"]
-            pallet_obj["x2"] = newRackSidePallets[id]["x2"]
-            pallet_obj["y2"] = newRackSidePallets[id]["y2"]
-            pallet_obj["conf"] = newRackSidePallets[id]["conf"]
-            pallet_obj["width"] = newRackSidePallets[id]["width"]
-            pallet_obj["height"] = newRackSidePallets[id]["height"]
-            pallet_obj["x0"] = newRackSidePallets[id]["x0"]
-            pallet_obj["y0"] = newRackSidePallets[id]["y0"]
-            pallet_obj["xd"] = newRackSidePallets[id]["xd"]
-            pallet_obj["yd"] = newRackSidePallets[id]["yd"]
-            pallet_obj["updateTime"] = newRackSidePallets[id]["updateTime"]
-            newRackSidePallets.pop(id)     
-            # print(f"update rackSidePallets[{len(rackSidePallets)}] === {pallet_obj}")       
-        else:            
-            for j, pallet in enumerate(newMovingPallets):
-                distance = distance_to_points((pallet["x0"], pallet["y0"]), (rackSidePallets[i]["x0"], rackSidePallets[i]["y0"]))
-                if min_distance > distance:
-                    min_distance = distance
-                    id  = j  
-            if id > -1 and rackSidePallets[i]["uuid"] is None: # in state
-                p_uuid = uuid.uuid4()
-                sendPostData("Stage", "IN", p_uuid, None, f"Stage In")
-                PALLET_STATUS = "in state"
-                print(f"========={PALLET_STATUS}")
-                new_pallet = {
-                    "uuid": p_uuid,
-                    "x1": newMovingPallets[id]["x1"],
-                    "y1": newMovingPallets[id]["y1"],
-                    "x2": newMovingPallets[id]["x2"],
-                    "y2": newMovingPallets[id]["y2"],
-                    "conf": newMovingPallets[id]["conf"],
-                    "width": newMovingPallets[id]["width"],
-                    "height": newMovingPallets[id]["height"],
-                    "x0": newMovingPallets[id]["x0"],
-                    "y0": newMovingPallets[id]["y0"],
-                    "xd": newMovingPallets[id]["xd"],
-                    "yd": newMovingPallets[id]["yd"],
-                    "updateTime": newMovingPallets[id]["updateTime"],
-                    "track_history": [(rackSidePallets[i]["x0"], rackSidePallets[i]["y0"])]
-                }
-                # print(f"add movingPallets[{len(movingPallets)}] === {new_pallet}")
-                movingPallets.append(new_pallet)
-                rackSidePallets.pop(i)
-                newMovingPallets.pop(id)
-            elif current_time - rackSidePallets[i]["updateTime"] > 3: # if update time is over 3 seconds, deleted
-                rackSidePallets.pop(i)
-            else: # other state
-                i += 1
-    # Process moving pallets
-    i = 0
-    while i < len(movingPallets):
-        if movingPallets[i]["uuid"] is None and len(movingPallets[i]["track_history"])>5:
-            moving_id = -1
-            min_distance = 1000
-            for j, pallet in enumerate(movingPallets):
-                if movingPallets[j]["uuid"] is None or current_time - movingPallets[j]["updateTime"] < 1 :
-                    continue
-                distance = distance_to_points((movingPallets[j]["x0"], movingPallets[j]["y0"]), (movingPallets[i]["x0"], movingPallets[i]["y0"]))
-                if min_distance > distance:
-                    min_distance = distance
-                    moving_id  = j 
-            if moving_id > -1:
-                #print(f"===========delete movingPallets[{len(movingPallets)}] === {i}, {moving_id}")
-                #print(f"===========infos [{movingPallets[i]}] === {movingPallets[moving_id]}")
-                movingPallets[i]["uuid"] = movingPallets[moving_id]["uuid"]
-                movingPallets.pop(moving_id)
-                if moving_id < i:
-                    i -=1
-               
-        min_distance = 50
-        id  = -1
-        for j, pallet in enumerate(newDoorSidePallets):
-            distance = distance_to_points((pallet["x0"], pallet["y0"]), (movingPallets[i]["x0"], movingPallets[i]["y0"]))
-            if min_distance > distance:
-                min_distance = distance
-                id  = j   
-        if id > -1: # load state
-            if movingPallets[i]["uuid"] is None:
-                moving_id = -1
-                min_distance = 1000
-                for j, pallet in enumerate(movingPallets):
-                    if movingPallets[j]["uuid"] is None:
-                        continue
-                    distance = distance_to_points((movingPallets[j]["x0"], movingPallets[j]["y0"]), (movingPallets[i]["x0"], movingPallets[i]["y0"]))
-                    if min_distance > distance:
-                        min_distance = distance
-                        moving_id  = j 
-                if  moving_id > -1:
-                    movingPallets[i]["uuid"] = movingPallets[moving_id]["uuid"]
-                    movingPallets.pop(moving_id)
-                    if i > moving_id:
-                        i -= 1  # Adjust index if we removed an element before current position
-            if movingPallets[i]["uuid"] is not None:
-                sendPostData("Dock", "LOD", movingPallets[i]["uuid"], None, f"Dock Load")
-                PALLET_STATUS = "load state"
-                print(f"========={PALLET_STATUS}")
-                new_pallet = {
-                    "uuid": movingPallets[i]["uuid"],
-                    "x1": newDoorSidePallets[id]["x1"],
-                    "y1": newDoorSidePallets[id]["y1"],
-                    "x2": newDoorSidePallets[id]["x2"],
-                    "y2": newDoorSidePallets[id]["y2"],
-                    "conf": newDoorSidePallets[id]["conf"],
-                    "width": newDoorSidePallets[id]["width"],
-                    "height": newDoorSidePallets[id]["height"],
-                    "x0": newDoorSidePallets[id]["x0"],
-                    "y0": newDoorSidePallets[id]["y0"],
-                    "xd": newDoorSidePallets[id]["xd"],
-                    "yd": newDoorSidePallets[id]["yd"],
-                    "updateTime": newDoorSidePallets[id]["updateTime"]
-                }
-                doorSidePallets.append(new_pallet)
-                movingPallets.pop(i)
-                newDoorSidePallets.pop(id)
-            else:
-                i += 1
-        else:    
-            for j, pallet in enumerate(newRackSidePallets):
-                distance = distance_to_points((pallet["x0"], pallet["y0"]), (movingPallets[i]["x0"], movingPallets[i]["y0"]))
-                if min_distance > distance:
-                    min_distance = distance
-                    id  = j   
-            if id > -1: # out state
-                if movingPallets[i]["uuid"] is None:
-                    moving_id = -1
-                    min_distance = 1000
-                    for j, pallet in enumerate(movingPallets):
-                        if movingPallets[j]["uuid"] is None:
-                            continue
-                        distance = distance_to_points((movingPallets[j]["x0"], movingPallets[j]["y0"]), (movingPallets[i]["x0"], movingPallets[i]["y0"]))
-                        if min_distance > distance:
-                            min_distance = distance
-                            moving_id  = j 
-                    if  moving_id > -1:
-                        movingPallets[i]["uuid"] = movingPallets[moving_id]["uuid"]
-                        movingPallets.pop(moving_id)
-                        if i > moving_id:
-                            i -= 1  # Adjust index if we removed an element before current position
-                if movingPallets[i]["uuid"] is not None:
-                    sendPostData("Stage", "Out", movingPallets[i]["uuid"], None, f"Stage Out")
-                    PALLET_STATUS = "out state"
-                    print(f"========={PALLET_STATUS}")
-                    new_pallet = {
-                        "uuid": movingPallets[i]["uuid"],
-                        "x1": newRackSidePallets[id]["x1"],
-                        "y1": newRackSidePallets[id]["y1"],
-                        "x2": newRackSidePallets[id]["x2"],
-                        "y2": newRackSidePallets[id]["y2"],
-                        "conf": newRackSidePallets[id]["conf"],
-                        "width": newRackSidePallets[id]["width"],
-                        "height": newRackSidePallets[id]["height"],
-                        "x0": newRackSidePallets[id]["x0"],
-                        "y0": newRackSidePallets[id]["y0"],
-                        "xd": newRackSidePallets[id]["xd"],
-                        "yd": newRackSidePallets[id]["yd"],
-                        "updateTime": newRackSidePallets[id]["updateTime"]
-                    }
-                    rackSidePallets.append(new_pallet)
-                    movingPallets.pop(i)
-                    newRackSidePallets.pop(id)
-                else:
-                    i += 1
-            else: 
-                for j, pallet in enumerate(newMovingPallets):
-                    distance = distance_to_points((pallet["x0"], pallet["y0"]), (movingPallets[i]["x0"], movingPallets[i]["y0"]))
-                    if min_distance > distance:
-                        min_distance = distance
-                        id  = j   
-                if id > -1: # moving state
-                    pallet_obj = movingPallets[i]
-                    pallet_obj["x1"] = newMovingPallets[id]["x1"]
-                    pallet_obj["y1"] = newMovingPallets[id]["y1"]
-                    pallet_obj["x2"] = newMovingPallets[id]["x2"]
-                    pallet_obj["y2"] = newMovingPallets[id]["y2"]
-                    pallet_obj["conf"] = newMovingPallets[id]["conf"]
-                    pallet_obj["width"] = newMovingPallets[id]["width"]
-                    pallet_obj["height"] = newMovingPallets[id]["height"]
-                    pallet_obj["x0"] = newMovingPallets[id]["x0"]
-                    pallet_obj["y0"] = newMovingPallets[id]["y0"]
-                    pallet_obj["xd"] = newMovingPallets[id]["xd"]
-                    pallet_obj["yd"] = newMovingPallets[id]["yd"]
-                    pallet_obj["updateTime"] = newMovingPallets[id]["updateTime"]
-                    pallet_obj["track_history"].append((newMovingPallets[id]["x0"], newMovingPallets[id]["y0"]))
-                    if len(pallet_obj["track_history"]) > 10:
-                        pallet_obj["track_history"] = pallet_obj["track_history"][-10:]
-                        max_deviation = distance_to_points(pallet_obj["track_history"][1], pallet_obj["track_history"][0])
-                        for point in pallet_obj["track_history"][2:-1]:
-                            if max_deviation < distance_to_points(point, pallet_obj["track_history"][0]):
-                                max_deviation = distance_to_points(point, pallet_obj["track_history"][0])
-                        if max_deviation < 5:
-                            # if rectangle of this pallet_obj is not full contained in all fixedPallets
-                            new_pallet = {
-                                "uuid": pallet_obj["uuid"],
-                                "x1": pallet_obj["x1"],
-                                "y1": pallet_obj["y1"],
-                                "x2": pallet_obj["x2"],
-                                "y2": pallet_obj["y2"],
-                                "conf": pallet_obj["conf"],
-                                "width": pallet_obj["width"],
-                                "height": pallet_obj["height"],
-                                "x0": pallet_obj["x0"],
-                                "y0": pallet_obj["y0"],
-                                "xd": pallet_obj["xd"],
-                                "yd": pallet_obj["yd"],
-                                "updateTime": pallet_obj["updateTime"],
-                                "track_history": pallet_obj["track_history"].copy()
-                            }                            
-                            matched_fixed_id = -1
-                            for j, pallet in enumerate(fixedPallets):
-                                if distance_to_points((pallet["x0"], pallet["y0"]), (new_pallet["x0"], new_pallet["y0"])) < 5:
-                                    matched_fixed_id = j
-                            if matched_fixed_id > -1:
-                                new_pallet["uuid"] = fixedPallets[matched_fixed_id]["uuid"]
-                                fixedPallets[matched_fixed_id].update(new_pallet)
-                                movingPallets.pop(i)
-                                i -= 1
-                            else:
-                                if new_pallet["uuid"]:
-                                    fixedPallets.append(new_pallet)
-                                    #print(f"------add fixedPallets[{len(fixedPallets)}] === {new_pallet}")
-                                    movingPallets.pop(i)
-                                    i -= 1
-                    newMovingPallets.pop(id) 
-                    i += 1
-                else:    
-                    if current_time - movingPallets[i]["updateTime"] > 3 and movingPallets[i]["uuid"] is None:
-                        movingPallets.pop(i)
-                    else:
-                        i += 1
-    # Process fixed pallets
-    i = 0
-    while i < len(fixedPallets):
-        min_distance = 5
-        id  = -1
-        for j, pallet in enumerate(newMovingPallets):
-            distance = distance_to_points((pallet["x0"], pallet["y0"]), (fixedPallets[i]["x0"], fixedPallets[i]["y0"]))
-            if min_distance > distance:
-                min_distance = distance
-                id  = j  
-        if id > -1:
-            if newMovingPallets[id]["conf"] > 0.5:
-                fixedPallets[i]["x1"] = newMovingPallets[id]["x1"]
-                fixedPallets[i]["y1"] = newMovingPallets[id]["y1"]
-                fixedPallets[i]["x2"] = newMovingPallets[id]["x2"]
-                fixedPallets[i]["y2"] = newMovingPallets[id]["y2"]
-                fixedPallets[i]["conf"] = newMovingPallets[id]["conf"]
-                fixedPallets[i]["width"] = newMovingPallets[id]["width"]
-                fixedPallets[i]["height"] = newMovingPallets[id]["height"]
-                fixedPallets[i]["x0"] = newMovingPallets[id]["x0"]
-                fixedPallets[i]["y0"] = newMovingPallets[id]["y0"]
-                fixedPallets[i]["xd"] = newMovingPallets[id]["xd"]
-                fixedPallets[i]["yd"] = newMovingPallets[id]["yd"]
-                fixedPallets[i]["updateTime"] = newMovingPallets[id]["updateTime"]
-                fixedPallets[i]["track_history"].append((newMovingPallets[id]["x0"], newMovingPallets[id]["y0"]))
-                if len(fixedPallets[i]["track_history"]) > 10:
-                    fixedPallets[i]["track_history"] = fixedPallets[i]["track_history"][-10:]
-            newMovingPallets.pop(id)
-        min_distance = 50
-        id  = -1
-        for j, pallet in enumerate(movingPallets):
-            distance = distance_to_points((pallet["x0"], pallet["y0"]), (fixedPallets[i]["x0"], fixedPallets[i]["y0"]))
-            if min_distance > distance:
-                min_distance = distance
-                id  = j        
-        if id > -1 and min_distance > 30 and movingPallets[id]["uuid"] is None: # moving state
-            #print(f"moving state[{len(movingPallets)}] === {fixedPallets[i]["uuid"]}")
-            movingPallets[id]["uuid"] = fixedPallets[i]["uuid"]
-            fixedPallets.pop(i)            
-        else:       
-            i += 1     
-            
-    # Add new moving pallets
-    for pallet in newMovingPallets:
-        new_pallet = {
-            "uuid": None,
-            "x1": pallet["x1"],
-            "y1": pallet["y1"],
-            "x2": pallet["x2"],
-            "y2": pallet["y2"],
-            "conf": pallet["conf"],
-            "width": pallet["width"],
-            "height": pallet["height"],
-            "x0": pallet["x0"],
-            "y0": pallet["y0"],
-            "xd": pallet["xd"],
-            "yd": pallet["yd"],
-            "updateTime": pallet["updateTime"],
-            "track_history": [(pallet["x0"], pallet["y0"])]
-        }
-        movingPallets.append(new_pallet)
-        #print(f"add movingPallets[{len(movingPallets)}] === {new_pallet}")
-    for pallet in newDoorSidePallets:
-        new_pallet = {
-            "uuid": None,
-            "x1": pallet["x1"],
-            "y1": pallet["y1"],
-            "x2": pallet["x2"],
-            "y2": pallet["y2"],
-            "conf": pallet["conf"],
-            "width": pallet["width"],
-            "height": pallet["height"],
-            "x0": pallet["x0"],
-            "y0": pallet["y0"],
-            "xd": pallet["xd"],
-            "yd": pallet["yd"],
-            "updateTime": pallet["updateTime"]
-        }
-        doorSidePallets.append(new_pallet)
-        #print(f"add doorSidePallets[{len(doorSidePallets)}] === {new_pallet}")
-    for pallet in newRackSidePallets:
-        new_pallet = {
-            "uuid": None,
-            "x1": pallet["x1"],
-            "y1": pallet["y1"],
-            "x2": pallet["x2"],
-            "y2": pallet["y2"],
-            "conf": pallet["conf"],
-            "width": pallet["width"],
-            "height": pallet["height"],
-            "x0": pallet["x0"],
-            "y0": pallet["y0"],
-            "xd": pallet["xd"],
-            "yd": pallet["yd"],
-            "updateTime": pallet["updateTime"]
-        }
-        rackSidePallets.append(new_pallet)
-        #print(f"add rackSidePallets[{len(rackSidePallets)}] === {new_pallet}")
-    resetNewPallets()
-
-objectForklift = None # x1, y1, x2, y2, conf, width, height, center_x, center_y
-def processForklift(forklift):
-    # cv2.rectangle(frame, (x1, y1), (x2, y2), (190, 0, 190), 2)
-    w, h = getWidthHeight(forklift["x1"], forklift["y1"], forklift["x2"], forklift["y2"])
-    x0, y0 = getCenterPos(forklift["x1"], forklift["y1"], forklift["x2"], forklift["y2"])
-    objectForklift = {"x1":forklift["x1"], "y1":forklift["y1"], "x2":forklift["x2"], "y2":forklift["y2"], "conf": forklift["conf"], "width":w, "height":h, "x0":x0, "y0":y0}
-    pass
-def detectObject(frame):
-    #print(f"-----------------------------------------------------")
-    #pallets = []
-    doors = []
-    forklift = None
-    results = model(frame)
-    detections = results.pandas().xyxy[0]
-    for _, row in detections.iterrows():    
-        x1, y1, x2, y2, conf, class_id, class_name = (
-            int(row["xmin"]),
-            int(row["ymin"]),
-            int(row["xmax"]),
-            int(row["ymax"]),
-            row["confidence"],
-            int(row["class"]),
-            row["name"],
-        )        
-        if class_name == "pallet":
-            validatePallet({"x1":x1, "y1":y1, "x2":x2, "y2":y2, "conf":conf})
-            #pallets.append({"x1":x1, "y1":y1, "x2":x2, "y2":y2, "conf":conf})
-            cv2.rectangle(frame, (x1, y1), (x2, y2), COLOR_PALLET, LINE_WIDTH)
-        elif class_name == "forklift":
-            forklift = {"x1":x1, "y1":y1, "x2":x2, "y2":y2, "conf":conf}
-        elif class_name == "door":
-            doors.append({"x1":x1, "y1":y1, "x2":x2, "y2":y2, "conf":conf})
-            #cv2.rectangle(frame, (x1, y1), (x2, y2), COLOR_GREEN, LINE_WIDTH)
-        else:
-            # Draw bounding box
-            cv2.rectangle(frame, (x1, y1), (x2, y2), COLOR_BLACK, LINE_WIDTH)
-    processDoors(doors)
-    processPallets()
-    # processForklift(forklift)
-    
-last_save_time = time.time()
-frame_counter = 0     
-def saveFrame(frame):
-    global last_save_time, frame_counter
-    current_time = time.time()
-    if current_time - last_save_time >= 2:
-        save_path = "image"
-        os.makedirs(save_path, exist_ok=True) 
-        file_name = os.path.join(save_path, f"frame_{frame_counter}.jpg")
-        cv2.imwrite(file_name, frame)
-        print(f"Saved {file_name}")
-        frame_counter += 1
-        last_save_time = current_time
-
-# async def video_stream(websocket):
-#     try:         
-#         processing_flag = 0
-#         print("Client connected.")      
-#         async for message in websocket:
-#             if processing_flag == 1:
-#                 print("Warning: Processing...")
-#                 continue
-#             nparr = np.frombuffer(message, np.uint8)
-#             # Decode the image
-#             frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR) # Decodes as BGR           
-
-#             if frame is None:
-#                 print("Warning: Received an empty or corrupt frame.")
-#                 continue      
-#             print(f"===1== {frame.shape} === {datetime.now().strftime('%H:%M:%S.%f')[:-3]}")
-#             #saveFrame(frame)    
-#             frame = cv2.resize(frame, (640, 640))
-#             # detectObject(frame)   
-#             # drawStagingArea(frame)
-#             # showFrame(frame)  
-#             processing_flag = 1
-#             await frame_processor(frame)
-#             processing_flag = 0
-#             print(f"===2== {frame.shape} === {datetime.now().strftime('%H:%M:%S.%f')[:-3]}")
-#             if cv2.waitKey(1) & 0xFF == ord('q'):
-#                 break          
-#     except websockets.exceptions.ConnectionClosed:
-#         print("Client disconnected.")
-#     finally:
-#         cv2.destroyAllWindows()
-#         resetObjects()
-#         print("Websocket signal is 'no', objects reset!")
-#         await asyncio.sleep(1)  # Non-blocking sleep
-
-# async def main():
-#     start_server = websockets.serve(video_stream, "localhost", 5001)
-#     async with start_server:
-#         print("WebSocket server started on ws://localhost:5001")
-#         await asyncio.Future()
-frame_queue = asyncio.Queue(maxsize=1)  # Keep only latest frame
-show_frame = None
-
-async def frame_processor():
-    global show_frame
-    while True:
-        frame = await frame_queue.get()
-        try:
-            # Simulate processing delay
-            #print(f"Processing Frame Started: {frame.shape} at {datetime.now().strftime('%H:%M:%S.%f')[:-3]}")
-            await asyncio.to_thread(detectObject, frame)
-            #print(f"Processing Frame detectObject end: {frame.shape} at {datetime.now().strftime('%H:%M:%S.%f')[:-3]}")
-            await asyncio.to_thread(drawStagingArea, frame)
-            #print(f"Processing Frame drawStagingArea end: {frame.shape} at {datetime.now().strftime('%H:%M:%S.%f')[:-3]}")
-            show_frame = frame
-            #await asyncio.to_thread(showFrame, frame)
-            #print(f"Processed Frame: {frame.shape} at {datetime.now().strftime('%H:%M:%S.%f')[:-3]}")
-        except Exception as e:
-            print(f"Error[frame_processor]: {e}")
-        finally:
-            frame_queue.task_done()
-async def video_stream(websocket):
-    global show_frame
-    # if websocket.request.path != '/unity1':
-    #     return 
-    print("Client connected.")
-    resetObjects()
-    try:
-        async for message in websocket:
-            nparr = np.frombuffer(message, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            if frame is None:
-                print("Warning: Received empty or corrupt frame.")
-                continue
-
-            frame = cv2.resize(frame, (640, 640))
-            #print(f"Received Frame: {frame.shape} at {datetime.now().strftime('%H:%M:%S.%f')[:-3]}")
-            
-            if frame_queue.empty():
-                await frame_queue.put(frame)
-            if show_frame is not None:
-                showFrame(show_frame)
-            #print(f"Show Frame: {frame.shape} at {datetime.now().strftime('%H:%M:%S.%f')[:-3]}")
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
-
-    except websockets.exceptions.ConnectionClosed:
-        print("Client disconnected.")
-    finally:
-        cv2.destroyAllWindows()
-        print("Websocket signal is 'no', objects reset!")
-        await asyncio.sleep(1)
-
-async def main():
-    start_server = websockets.serve(video_stream, "0.0.0.0", 5000)
-    asyncio.create_task(frame_processor())  # Start frame processor in background
-    async with start_server:
-        print("WebSocket server started on ws://0.0.0.0:5000")
-        await asyncio.Future()  # Run forever
-if __name__ == "__main__":
-    try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
-        print("Server stopped by user.")
+import asyncio
+import websockets
+import numpy as np
+import torch
+import cv2
+import time
+import os
+import uuid
+import requests
+import json
+from datetime import datetime
+import threading
+import sqlite3
+import argparse
+import re
+import subprocess
+import shutil
+import sys
+import aiohttp
+import signal
+import bisect
+import collections
+import struct
+import multiprocessing
+import queue
+from multiprocessing import shared_memory
+from aiohttp import web
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None # fall back to gated greedy matching
+
+API_URL = "http://127.0.0.1:5001/api/"
+DEFAULT_CAMERA_ID = "Camera01"
+MODEL_WEIGHTS = "best.pt"
+MODEL_CONF = 0.4  # Set confidence threshold
+MODEL_IOU = 0.5   # Set IoU threshold for NMS
+MODEL_MAX_DET = 1000
+MODEL_INPUT_SIZE = 640
+MODEL_CACHE_DIR = "model_cache" # exported ONNX / OpenVINO models
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "torch") # torch | torchscript | onnx | openvino
+MODEL_WARMUP_RUNS = 2         # forward passes on a blank frame before the first camera frame
+INFERENCE_ROI = os.environ.get("INFERENCE_ROI", "0") == "1" # run the model on a crop around the zones only
+ROI_INPUT_SIZE = int(os.environ.get("ROI_INPUT_SIZE", MODEL_INPUT_SIZE)) # model input size in ROI mode, e.g. 416 or 480
+ROI_MARGIN = 64               # pixels added around the staging area and the doors
+ROI_REFRESH_INTERVAL = 10.0   # seconds, run on the whole frame this often to find new doors
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", "0")) # model in N worker processes, 0 runs it in this process
+WORKER_TORCH_THREADS = int(os.environ.get("WORKER_TORCH_THREADS", "0")) # torch threads per worker, 0: cores / workers
+WORKER_CPU_AFFINITY = os.environ.get("WORKER_CPU_AFFINITY", "0") == "1" # pin every worker to its own cores (Linux)
+
+def loadTorchModel(weights=MODEL_WEIGHTS):
+    model = torch.hub.load("yolov5", "custom", path=weights, source="local")
+    model.conf = MODEL_CONF
+    model.iou = MODEL_IOU
+    model.max_det = MODEL_MAX_DET
+    return model
+
+def letterbox(frame, size):
+    # Resize keeping the aspect ratio and pad to size x size like YOLOv5 does.
+    # Returns the padded image, the scale and the (left, top) padding.
+    height, width = frame.shape[:2]
+    scale = min(size / height, size / width)
+    new_width, new_height = int(round(width * scale)), int(round(height * scale))
+    if (new_width, new_height) != (width, height):
+        frame = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    left = (size - new_width) // 2
+    top = (size - new_height) // 2
+    if left or top or new_width != size or new_height != size:
+        frame = cv2.copyMakeBorder(frame, top, size - new_height - top, left, size - new_width - left,
+                                   cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return frame, scale, (left, top)
+
+def nonMaxSuppression(prediction, conf_thres=MODEL_CONF, iou_thres=MODEL_IOU, max_det=MODEL_MAX_DET):
+    # Raw YOLOv5 head output (N, 5 + classes) of cx, cy, w, h, objectness, class
+    # scores -> (M, 6) x1, y1, x2, y2, conf, class. Same thresholds and per-class
+    # NMS as the PyTorch path.
+    prediction = prediction[prediction[:, 4] > conf_thres]
+    if not len(prediction):
+        return np.zeros((0, 6), dtype=np.float32)
+    scores = prediction[:, 5:] * prediction[:, 4:5]
+    class_ids = scores.argmax(axis=1)
+    confs = scores[np.arange(len(scores)), class_ids]
+    keep = confs > conf_thres
+    prediction, class_ids, confs = prediction[keep], class_ids[keep], confs[keep]
+    if not len(prediction):
+        return np.zeros((0, 6), dtype=np.float32)
+    boxes = np.empty((len(prediction), 4), dtype=np.float32)
+    boxes[:, 0] = prediction[:, 0] - prediction[:, 2] / 2
+    boxes[:, 1] = prediction[:, 1] - prediction[:, 3] / 2
+    boxes[:, 2] = prediction[:, 0] + prediction[:, 2] / 2
+    boxes[:, 3] = prediction[:, 1] + prediction[:, 3] / 2
+    # offset boxes by class so that NMS only suppresses boxes of the same class
+    offsets = class_ids[:, None].astype(np.float32) * 7680
+    nms_boxes = boxes + offsets
+    order = np.argsort(-confs)
+    x1, y1, x2, y2 = nms_boxes[:, 0], nms_boxes[:, 1], nms_boxes[:, 2], nms_boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    keep = []
+    while len(order) and len(keep) < max_det:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        inter_w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        inter_h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = inter_w * inter_h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-7)
+        order = rest[iou <= iou_thres]
+    keep = np.array(keep, dtype=np.int64)
+    return np.concatenate([boxes[keep], confs[keep, None], class_ids[keep, None].astype(np.float32)], axis=1)
+
+class TorchBackend:
+    # YOLOv5 AutoShape model in PyTorch eager mode, always available
+    name = "torch"
+
+    def __init__(self, weights=MODEL_WEIGHTS, input_size=MODEL_INPUT_SIZE):
+        self.model = loadTorchModel(weights)
+        self.inputSize = input_size
+        names = self.model.names
+        self.names = dict(names.items() if isinstance(names, dict) else enumerate(names))
+
+    def infer(self, frames):
+        results = self.model(frames, size=self.inputSize)
+        return [det.cpu().numpy() for det in results.xyxy]
+
+class ExportedBackend:
+    # Common pre/post-processing of exported YOLOv5 graphs. Frames are fed in
+    # the same channel order as the PyTorch path gets them.
+    name = None
+    exportFormat = None
+
+    def __init__(self, weights=MODEL_WEIGHTS, input_size=MODEL_INPUT_SIZE):
+        self.inputSize = input_size
+        self.modelPath, self.names = exportModel(weights, self.exportFormat, input_size)
+
+    def preprocess(self, frames):
+        batch = np.empty((len(frames), 3, self.inputSize, self.inputSize), dtype=np.float32)
+        transforms = []
+        for i, frame in enumerate(frames):
+            image, scale, pad = letterbox(frame, self.inputSize)
+            batch[i] = image.transpose(2, 0, 1)
+            transforms.append((scale, pad, frame.shape[:2]))
+        batch /= 255.0
+        return batch, transforms
+
+    def postprocess(self, prediction, transforms):
+        detections = []
+        for frame_prediction, (scale, (left, top), (height, width)) in zip(prediction, transforms):
+            det = nonMaxSuppression(frame_prediction)
+            det[:, [0, 2]] = np.clip((det[:, [0, 2]] - left) / scale, 0, width)
+            det[:, [1, 3]] = np.clip((det[:, [1, 3]] - top) / scale, 0, height)
+            detections.append(det)
+        return detections
+
+    def infer(self, frames):
+        batch, transforms = self.preprocess(frames)
+        return self.postprocess(self.run(batch), transforms)
+
+class OnnxBackend(ExportedBackend):
+    name = "onnx"
+    exportFormat = "onnx"
+
+    def __init__(self, weights=MODEL_WEIGHTS, input_size=MODEL_INPUT_SIZE):
+        import onnxruntime
+        super().__init__(weights, input_size)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(self.modelPath, options, providers=["CPUExecutionProvider"])
+        self.inputName = self.session.get_inputs()[0].name
+
+    def run(self, batch):
+        return self.session.run(None, {self.inputName: batch})[0]
+
+class OpenVinoBackend(ExportedBackend):
+    name = "openvino"
+    exportFormat = "openvino"
+
+    def __init__(self, weights=MODEL_WEIGHTS, input_size=MODEL_INPUT_SIZE):
+        import openvino
+        super().__init__(weights, input_size)
+        core = openvino.Core()
+        network = core.read_model(self.modelPath)
+        network.reshape([-1, 3, input_size, input_size]) # any batch size
+        self.compiled = core.compile_model(network, "CPU", {"PERFORMANCE_HINT": "THROUGHPUT"})
+        self.output = self.compiled.output(0)
+
+    def run(self, batch):
+        return self.compiled([batch])[self.output]
+
+class TorchScriptBackend(ExportedBackend):
+    # Traced graph loaded with torch.jit.load, starts without importing the
+    # yolov5 hub code (and pandas) once the export is cached
+    name = "torchscript"
+    exportFormat = "torchscript"
+
+    def __init__(self, weights=MODEL_WEIGHTS, input_size=MODEL_INPUT_SIZE):
+        super().__init__(weights, input_size)
+        self.model = torch.jit.load(self.modelPath, map_location="cpu").eval()
+
+    def run(self, batch):
+        with torch.inference_mode():
+            return self.model(torch.from_numpy(batch))[0].numpy()
+
+def exportModel(weights, export_format, input_size):
+    # Export weights with yolov5/export.py once and cache the result in
+    # MODEL_CACHE_DIR, re-exporting when the weights file is newer.
+    # Returns the model path and the class names.
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+    if export_format == "openvino":
+        model_path = os.path.join(MODEL_CACHE_DIR, f"{stem}_{input_size}_openvino", f"{stem}.xml")
+    else:
+        model_path = os.path.join(MODEL_CACHE_DIR, f"{stem}_{input_size}.{export_format}")
+    names_path = os.path.join(MODEL_CACHE_DIR, f"{stem}.names.json")
+    if (not os.path.exists(model_path) or not os.path.exists(names_path)
+            or os.path.getmtime(model_path) < os.path.getmtime(weights)):
+        print(f"Exporting {weights} to {export_format}, this runs once...")
+        subprocess.run([sys.executable, os.path.join("yolov5", "export.py"), "--weights", weights,
+                        "--include", export_format, "--imgsz", str(input_size), "--dynamic"], check=True)
+        if export_format == "openvino":
+            export_dir = os.path.join(os.path.dirname(weights), f"{stem}_openvino_model")
+            shutil.rmtree(os.path.dirname(model_path), ignore_errors=True)
+            shutil.move(export_dir, os.path.dirname(model_path))
+        else:
+            os.replace(os.path.join(os.path.dirname(weights), f"{stem}.{export_format}"), model_path)
+        names = TorchBackend(weights, input_size).names
+        with open(names_path, "w") as f:
+            json.dump({str(class_id): name for class_id, name in names.items()}, f)
+    with open(names_path) as f:
+        names = {int(class_id): name for class_id, name in json.load(f).items()}
+    return model_path, names
+
+INFERENCE_BACKENDS = {"torch": TorchBackend, "torchscript": TorchScriptBackend, "onnx": OnnxBackend,
+                      "openvino": OpenVinoBackend}
+
+def createInferenceBackend(name=INFERENCE_BACKEND, input_size=MODEL_INPUT_SIZE):
+    backend_class = INFERENCE_BACKENDS.get(name)
+    if backend_class is None:
+        print(f"Warning: unknown inference backend '{name}', using torch")
+        backend_class = TorchBackend
+    if backend_class is not TorchBackend:
+        try:
+            backend = backend_class(input_size=input_size)
+            print(f"Inference backend: {backend.name} ({backend.modelPath})")
+            return backend
+        except Exception as e:
+            print(f"Error[inference_backend]: {name} is not available ({e}), falling back to torch")
+    return TorchBackend(input_size=input_size)
+
+def warmUpBackend(backend, input_size=MODEL_INPUT_SIZE):
+    # The first forward passes allocate buffers and pick kernels, pay for that
+    # before the cameras do: once with a single frame and once with a full batch
+    frame = np.full((input_size, input_size, 3), 114, dtype=np.uint8)
+    for run in range(MODEL_WARMUP_RUNS):
+        backend.infer([frame] * (1 if run == 0 else INFERENCE_BATCH_SIZE))
+
+def setModelClasses(names):
+    global MODEL_CLASS_IDS, CLASS_PALLET, CLASS_DOOR, CLASS_FORKLIFT
+    MODEL_CLASS_IDS = {name: class_id for class_id, name in names.items()}
+    CLASS_PALLET = MODEL_CLASS_IDS.get("pallet", -1)
+    CLASS_DOOR = MODEL_CLASS_IDS.get("door", -1)
+    CLASS_FORKLIFT = MODEL_CLASS_IDS.get("forklift", -1)
+
+MODEL_INFERENCE_SIZE = ROI_INPUT_SIZE if INFERENCE_ROI else MODEL_INPUT_SIZE
+# Loaded on first use by model_loader, in this process or, with
+# INFERENCE_WORKERS, only in the worker processes. The class ids are set
+# from the names the model reports.
+inference_backend = None
+model_lock = threading.Lock() # the model is shared by all camera sessions
+setModelClasses({})
+INFERENCE_BATCH_SIZE = 4      # max frames per forward pass
+INFERENCE_BATCH_WAIT = 0.015  # seconds to wait for other cameras before running a partial batch
+MAX_FRAME_LATENCY = 1.0       # seconds, frames older than this are dropped instead of inferred
+MAX_FRAME_AGE = 0.5           # seconds, frames that waited longer in the slot are skipped before decoding
+
+HEADLESS = os.environ.get("HEADLESS", "0") == "1" # no cv2 windows, annotate frames only for preview viewers
+HTTP_PORT = int(os.environ.get("HTTP_PORT", "8080")) # preview and /metrics, 0 disables it
+PREVIEW_FPS = 5               # max frames per second encoded for preview viewers
+PREVIEW_JPEG_QUALITY = 70
+
+METRICS_PREFIX = "dock_tracker"
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0) # seconds
+
+class Histogram:
+    # Prometheus style cumulative histogram keyed by label values, safe to
+    # observe from the worker threads.
+    def __init__(self, name, help_text, label_names, buckets=STAGE_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelNames = label_names
+        self.buckets = buckets
+        self.series = {} # label values -> [bucket counts..., count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = int(np.searchsorted(self.buckets, value))
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 2)
+            for i in range(index, len(self.buckets)):
+                series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def time(self, *labels):
+        return StageTimer(self, labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            items = sorted((labels, list(series)) for labels, series in self.series.items())
+        for labels, series in items:
+            label_text = ",".join(f'{name}="{value}"' for name, value in zip(self.labelNames, labels))
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {series[-2]}')
+            lines.append(f"{self.name}_count{{{label_text}}} {series[-2]}")
+            lines.append(f"{self.name}_sum{{{label_text}}} {series[-1]:.6f}")
+        return lines
+
+class StageTimer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        ended = time.perf_counter()
+        self.histogram.observe(ended - self.started, *self.labels)
+        if frame_tracer.active:
+            frame_tracer.record(*self.labels, self.started, ended)
+
+class RateMeter:
+    # Exponentially smoothed events per second, reads 0 once ticks stop arriving;
+    # the gap of such a stall is not averaged into the rate
+    def __init__(self, smoothing=0.1, idle=2.0):
+        self.smoothing = smoothing
+        self.idle = idle
+        self.last = None
+        self.interval = None
+
+    def tick(self, now=None):
+        now = time.monotonic() if now is None else now
+        if self.last is not None and (self.interval is None or not self.isIdle(now)):
+            interval = now - self.last
+            self.interval = interval if self.interval is None else self.interval + self.smoothing * (interval - self.interval)
+        self.last = now
+
+    def isIdle(self, now=None):
+        # no rate yet, or no tick for longer than the idle time
+        now = time.monotonic() if now is None else now
+        return not self.interval or now - self.last > max(self.idle, 2 * self.interval)
+
+    def rate(self, now=None):
+        return 0.0 if self.isIdle(now) else 1.0 / self.interval
+
+# decode: imdecode + resize, inference: one batched forward pass (camera="batch"),
+# event_post: one POST round trip to API_URL (camera="api")
+stage_seconds = Histogram(f"{METRICS_PREFIX}_stage_seconds", "Time spent per pipeline stage", ("stage", "camera"))
+
+TRACE_DIR = "traces"
+TRACE_FRAMES = 100            # frames traced per request (SIGUSR1 or POST /trace?frames=N)
+
+class TraceSpan:
+    def __init__(self, tracer, name, camera):
+        self.tracer = tracer
+        self.name = name
+        self.camera = camera
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.camera, self.started, time.perf_counter())
+
+class NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NO_SPAN = NoSpan()
+
+class FrameTracer:
+    # Records the stage timers and tracking spans of the next N processed frames
+    # and writes them as a Chrome trace (chrome://tracing, ui.perfetto.dev,
+    # speedscope). While it is off span() hands out a shared no-op context.
+    def __init__(self, trace_dir=TRACE_DIR):
+        self.traceDir = trace_dir
+        self.active = False
+        self.remaining = 0
+        self.events = []
+        self.threads = {}
+        self.path = None
+        self.lock = threading.Lock()
+
+    def start(self, frames=TRACE_FRAMES):
+        with self.lock:
+            if self.active:
+                self.remaining = max(self.remaining, frames)
+                return self.path
+            os.makedirs(self.traceDir, exist_ok=True)
+            self.path = os.path.join(self.traceDir, f"trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+            self.events = []
+            self.threads = {}
+            self.remaining = frames
+            self.active = True
+        print(f"Tracing the next {frames} frames to {self.path}")
+        return self.path
+
+    def span(self, name, camera):
+        return TraceSpan(self, name, camera) if self.active else NO_SPAN
+
+    def record(self, name, camera, started, ended):
+        thread = threading.current_thread()
+        self.threads.setdefault(thread.ident, thread.name)
+        self.events.append({"name": name, "cat": camera, "ph": "X", "pid": os.getpid(), "tid": thread.ident,
+                            "ts": started * 1e6, "dur": (ended - started) * 1e6, "args": {"camera": camera}})
+
+    def frameDone(self):
+        if not self.active:
+            return
+        with self.lock:
+            self.remaining -= 1
+            if self.remaining > 0:
+                return
+            self.active = False
+            events, threads, path = self.events, self.threads, self.path
+            self.events, self.threads = [], {}
+        threading.Thread(target=self.write, args=(path, events, threads), daemon=True).start()
+
+    def write(self, path, events, threads):
+        metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": ident, "args": {"name": name}}
+                    for ident, name in threads.items()]
+        try:
+            with open(path, "w") as f:
+                json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+            print(f"Trace of {len(events)} spans written to {path}")
+        except OSError as e:
+            print(f"Error[frame_tracer]: {e}")
+
+frame_tracer = FrameTracer()
+
+STAGING_AREA_BOUNDS = [
+    (160, 240),  # Top-left  Door Side Line
+    (344, 110),  # Top-right Door Side Line
+    (580, 260),  # Bottom-right In/Out Side Line
+    (458, 638)   # Bottom-left In/Out Side Line
+]
+COLOR_RED = (0, 0, 255)
+COLOR_GREEN = (0, 255, 0)
+COLOR_BLUE = (0, 0, 255)
+COLOR_BLACK = (0, 0, 0)
+COLOR_PALLET = (200, 0, 0)
+G_FONT = cv2.FONT_HERSHEY_SIMPLEX
+LINE_WIDTH = 1
+G_FONT_SCALE = 0.5
+EVENT_BATCH_SIZE = 50       # max events per request to API_BULK_ENDPOINT
+EVENT_RETRY_BACKOFF = 0.5   # seconds, doubled on every failed attempt
+EVENT_RETRY_BACKOFF_MAX = 30
+EVENT_REQUEST_TIMEOUT = 10
+API_BULK_ENDPOINT = None    # e.g. "Bulk" to post batches of events to API_URL + "Bulk"
+OUTBOX_PATH = "event_outbox.db"
+OUTBOX_MAX_EVENTS = 100000  # undelivered events kept, the oldest are dropped beyond this
+OUTBOX_KEEP_DELIVERED = 1000 # delivered events kept for inspection
+
+EVENT_PENDING = 0
+EVENT_DELIVERED = 1
+EVENT_REJECTED = 2 # the API refused it (4xx), not retried
+EVENT_RETRY = 3
+
+class EventOutbox:
+    # Append-only SQLite (WAL) log of every event. Events are written here before
+    # they are sent and stay pending until the API has accepted them, so nothing
+    # is lost while the API is down.
+    def __init__(self, path=OUTBOX_PATH, max_events=OUTBOX_MAX_EVENTS, keep_delivered=OUTBOX_KEEP_DELIVERED):
+        self.path = path
+        self.maxEvents = max_events
+        self.keepDelivered = keep_delivered
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.appends = 0
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created REAL NOT NULL,
+            doc_cat TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            comments TEXT,
+            status INTEGER NOT NULL DEFAULT 0)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS events_status ON events (status, id)")
+
+    def append(self, doc_cat, payload, comments):
+        with self.lock:
+            cursor = self.db.execute("INSERT INTO events (created, doc_cat, payload, comments) VALUES (?, ?, ?, ?)",
+                                     (time.time(), doc_cat, json.dumps(payload), comments))
+            self.appends += 1
+            if self.appends % 100 == 0:
+                self.trim()
+            return cursor.lastrowid
+
+    def trim(self):
+        # keep the outbox bounded, called with the lock held
+        pending = self.db.execute("SELECT COUNT(*) FROM events WHERE status = ?", (EVENT_PENDING,)).fetchone()[0]
+        if pending > self.maxEvents:
+            overflow = pending - self.maxEvents
+            self.db.execute("DELETE FROM events WHERE id IN (SELECT id FROM events WHERE status = ? ORDER BY id LIMIT ?)",
+                            (EVENT_PENDING, overflow))
+            self.dropped += overflow
+            print(f"❌ Event outbox is full, dropped the {overflow} oldest undelivered events")
+        self.db.execute("DELETE FROM events WHERE status != ? AND id NOT IN (SELECT id FROM events WHERE status != ? ORDER BY id DESC LIMIT ?)",
+                        (EVENT_PENDING, EVENT_PENDING, self.keepDelivered))
+
+    def pending(self, limit):
+        # oldest first: (id, doc_cat, payload, comments)
+        with self.lock:
+            rows = self.db.execute("SELECT id, doc_cat, payload, comments FROM events WHERE status = ? ORDER BY id LIMIT ?",
+                                   (EVENT_PENDING, limit)).fetchall()
+        return [(event_id, doc_cat, json.loads(payload), comments) for event_id, doc_cat, payload, comments in rows]
+
+    def pendingCount(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM events WHERE status = ?", (EVENT_PENDING,)).fetchone()[0]
+
+    def mark(self, event_ids, status):
+        if not event_ids:
+            return
+        with self.lock:
+            self.db.execute("BEGIN")
+            self.db.executemany("UPDATE events SET status = ? WHERE id = ?", [(status, event_id) for event_id in event_ids])
+            self.db.execute("COMMIT")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+class EventDispatcher:
+    # Long-lived sender for Dock/Stage/Door events. Runs on the main event loop
+    # with one keep-alive HTTP session and drains the outbox in order: one bulk
+    # request per batch when API_BULK_ENDPOINT is set, otherwise one request
+    # per event, each sent after the previous one was answered. Failed sends
+    # stay in the outbox and are retried with backoff until the API is back,
+    # nothing behind them is sent before.
+    def __init__(self, api_url=API_URL, bulk_endpoint=API_BULK_ENDPOINT, outbox_path=OUTBOX_PATH,
+                 batch_size=EVENT_BATCH_SIZE):
+        self.apiUrl = api_url.rstrip('/')
+        self.bulkEndpoint = bulk_endpoint
+        self.outboxPath = outbox_path
+        self.batchSize = batch_size
+        self.outbox = None
+        self.loop = None
+        self.wakeup = None
+        self.session = None
+        self.drainer = None
+        self.sent = 0
+        self.rejected = 0
+        self.dropped = 0
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        if self.outbox is None:
+            self.outbox = EventOutbox(self.outboxPath)
+        connector = aiohttp.TCPConnector(limit=1, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=EVENT_REQUEST_TIMEOUT))
+        self.drainer = asyncio.create_task(self.drain())
+        backlog = self.outbox.pendingCount()
+        if backlog:
+            print(f"Event outbox: replaying {backlog} undelivered events")
+
+    async def close(self):
+        if self.drainer is not None:
+            self.drainer.cancel()
+            await asyncio.gather(self.drainer, return_exceptions=True)
+            self.drainer = None
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        if self.outbox is not None:
+            self.outbox.close()
+            self.outbox = None
+
+    def submit(self, doc_cat, payload, comments):
+        # Thread-safe, called from the tracking threads
+        if self.outbox is None:
+            self.dropped += 1
+            print(f"❌ Event dispatcher is not running, dropped {doc_cat} event: {payload}")
+            return
+        self.outbox.append(doc_cat, payload, comments)
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    async def drain(self):
+        backoff = EVENT_RETRY_BACKOFF
+        while True:
+            self.wakeup.clear()
+            events = self.outbox.pending(self.batchSize)
+            if not events:
+                await self.wakeup.wait()
+                continue
+            try:
+                delivered = await self.deliver(events)
+            except Exception as e:
+                print(f"Error[event_dispatcher]: {e}")
+                delivered = False
+            if delivered:
+                backoff = EVENT_RETRY_BACKOFF
+            else:
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, EVENT_RETRY_BACKOFF_MAX)
+
+    async def deliver(self, events):
+        # Returns False when something has to be retried
+        if self.bulkEndpoint:
+            url = f"{self.apiUrl}/{self.bulkEndpoint}"
+            statuses = [await self.post(url, [payload for _, _, payload, _ in events], f"{len(events)} events")] * len(events)
+        else:
+            statuses = []
+            for _, doc_cat, payload, comments in events:
+                statuses.append(await self.post(f"{self.apiUrl}/{doc_cat}", payload, comments))
+                if statuses[-1] == EVENT_RETRY:
+                    break # the later ones stay pending behind it
+        for status in (EVENT_DELIVERED, EVENT_REJECTED):
+            self.outbox.mark([event[0] for event, event_status in zip(events, statuses) if event_status == status], status)
+        self.sent += statuses.count(EVENT_DELIVERED)
+        self.rejected += statuses.count(EVENT_REJECTED)
+        return EVENT_RETRY not in statuses
+
+    async def post(self, url, payload, comments):
+        with stage_seconds.time("event_post", "api"):
+            return await self.postOnce(url, payload, comments)
+
+    async def postOnce(self, url, payload, comments):
+        try:
+            print(f"Sending async request to {url} with payload: {payload}")
+            async with self.session.post(url, json=payload) as response:
+                # Check if the request was successful
+                if response.status >= 400:
+                    error_text = await response.text()
+                    print(f"❌ HTTP Error {response.status}: {error_text}")
+                    return EVENT_RETRY if response.status >= 500 or response.status == 429 else EVENT_REJECTED
+                
+                # Return the JSON response
+                try:
+                    result = await response.json(content_type=None)
+                except ValueError:
+                    result = await response.text()
+                print(f"✅ {comments} API Response: {result}")
+                return EVENT_DELIVERED
+        except aiohttp.ClientConnectorError:
+            print(f"❌ Connection Error: Could not connect to {url}")
+        except asyncio.TimeoutError:
+            print(f"❌ Timeout Error: Request to {url} timed out")
+        except aiohttp.ClientError as e:
+            print(f"❌ API Request Failed: {e}")
+        return EVENT_RETRY
+
+event_dispatcher = EventDispatcher()
+
+def sendPostData(doc_cat, doc_type, pallet_id, door_id, comments, camera_no=DEFAULT_CAMERA_ID):
+    if pallet_id is not None and isinstance(pallet_id, uuid.UUID):
+        pallet_id = str(pallet_id)
+
+    #Read from customizing.....??? replace with camera IP
+    payload = {
+        "WHNUM": "WH001",
+        "CameraNO": camera_no,
+        "DocCat": doc_cat,       
+        "DocType": doc_type,
+        "PAK_ID": pallet_id,
+        "DoorNO": door_id
+    }
+    event_dispatcher.submit(doc_cat, payload, comments)
+def ValidateyStagingArea(bounds=STAGING_AREA_BOUNDS):
+    if (bounds[0][0] > bounds[1][0]):
+        return False
+    if (bounds[3][0] > bounds[2][0]):
+        return False
+    return True
+
+def showFrame(frame, camera_id=None):    
+    cv2.imshow(f"Received Frame {camera_id}" if camera_id else 'Received Frame', frame)
+
+def palletCenters(pallets, at_time=None):
+    # at_time: predict the centers to this time from the track velocities
+    if at_time is None:
+        return np.array([(pallet.x0, pallet.y0) for pallet in pallets], dtype=np.float32).reshape(-1, 2)
+    return np.array([pallet.predictCenter(at_time) for pallet in pallets], dtype=np.float32).reshape(-1, 2)
+def pointDistances(points1, points2):
+    # (N, 2) x (M, 2) -> (N, M) euclidean distance matrix
+    return np.hypot(points1[:, None, 0] - points2[None, :, 0], points1[:, None, 1] - points2[None, :, 1])
+def matchDistances(distances, gate):
+    # (tracks, detections) distance matrix -> {track index: detection index},
+    # matched pairs must be closer than gate, a scalar or one per track
+    if not distances.size:
+        return {}
+    gate = np.asarray(gate, dtype=np.float64)
+    gate = np.broadcast_to(gate[:, None] if gate.ndim else gate, distances.shape)
+    if linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(np.where(distances < gate, distances, gate * 1000))
+        return {int(i): int(j) for i, j in zip(rows, cols) if distances[i, j] < gate[i, j]}
+    # gated greedy, closest pairs first
+    rows, cols = np.nonzero(distances < gate)
+    order = np.argsort(distances[rows, cols], kind="stable")
+    matches = {}
+    used = set()
+    for i, j in zip(rows[order].tolist(), cols[order].tolist()):
+        if i not in matches and j not in used:
+            matches[i] = j
+            used.add(j)
+    return matches
+TRACK_HISTORY_SIZE = 10
+TRACK_GATE = 50 # pixels a pallet center may move between two detections of the same track
+TRACK_PREDICTION_ERROR = 0.5 # fraction of its speed a moving track's predicted center may be off by, per second predicted
+
+class TrackHistory:
+    # Fixed-size ring buffer of the last TRACK_HISTORY_SIZE pallet centers
+    __slots__ = ("points", "count", "head")
+
+    def __init__(self, x0, y0, size=TRACK_HISTORY_SIZE):
+        self.points = np.empty((size, 2), dtype=np.float32)
+        self.points[0] = (x0, y0)
+        self.count = 1
+        self.head = 1
+
+    def __len__(self):
+        return self.count
+
+    def isFull(self):
+        return self.count == len(self.points)
+
+    def append(self, x0, y0):
+        self.points[self.head] = (x0, y0)
+        self.head = (self.head + 1) % len(self.points)
+        self.count = min(self.count + 1, len(self.points))
+
+    def ordered(self):
+        # oldest first
+        if not self.isFull():
+            return self.points[:self.count]
+        return np.roll(self.points, -self.head, axis=0)
+
+    def maxDeviation(self):
+        # largest distance of history[1:-1] from the oldest point
+        points = self.ordered()
+        return float(np.hypot(*(points[1:-1] - points[0]).T).max())
+
+class PalletTrack:
+    # One pallet track of PalletTracker. state is the zone it was last seen in,
+    # with staging split into moving and fixed (TRACK_* codes).
+    __slots__ = ("uuid", "state", "x1", "y1", "x2", "y2", "conf", "x0", "y0", "xd", "yd", "updateTime", "history", "vx", "vy", "hits")
+
+    def __init__(self, x1, y1, x2, y2, conf, x0, y0, xd, yd, update_time, state):
+        self.uuid = None
+        self.state = state
+        self.x1, self.y1, self.x2, self.y2 = x1, y1, x2, y2
+        self.conf = conf
+        self.x0, self.y0 = x0, y0
+        self.xd, self.yd = xd, yd
+        self.updateTime = update_time
+        self.history = TrackHistory(x0, y0) if state == TRACK_MOVING else None # moving and fixed pallets only
+        self.vx = self.vy = 0.0 # center velocity in pixels per second, from the detections only
+        self.hits = 1
+
+    def update(self, x1, y1, x2, y2, conf, x0, y0, xd, yd, update_time):
+        dt = update_time - self.updateTime
+        if dt > 0:
+            self.vx += VELOCITY_SMOOTHING * ((x0 - self.x0) / dt - self.vx)
+            self.vy += VELOCITY_SMOOTHING * ((y0 - self.y0) / dt - self.vy)
+        self.x1, self.y1, self.x2, self.y2 = x1, y1, x2, y2
+        self.conf = conf
+        self.x0, self.y0 = x0, y0
+        self.xd, self.yd = xd, yd
+        self.updateTime = update_time
+        self.hits += 1
+
+    def predictCenter(self, at_time):
+        dt = min(at_time - self.updateTime, KEYFRAME_MAX_INTERVAL)
+        return self.x0 + self.vx * dt, self.y0 + self.vy * dt
+
+    def predictBox(self, at_time):
+        x0, y0 = self.predictCenter(at_time)
+        dx, dy = int(round(x0 - self.x0)), int(round(y0 - self.y0))
+        return self.x1 + dx, self.y1 + dy, self.x2 + dx, self.y2 + dy
+
+    def snapshot(self):
+        return {"uuid": str(self.uuid) if self.uuid is not None else None, "state": self.state,
+                "box": [self.x1, self.y1, self.x2, self.y2], "conf": self.conf, "center": [self.x0, self.y0],
+                "door": [self.xd, self.yd], "updateTime": self.updateTime, "hits": self.hits,
+                "history": self.history.ordered().tolist() if self.history is not None else None}
+
+    @classmethod
+    def fromSnapshot(cls, data):
+        (x1, y1, x2, y2), (x0, y0), (xd, yd) = data["box"], data["center"], data["door"]
+        # the velocity starts at zero, it says nothing about the pallet after the gap
+        track = cls(x1, y1, x2, y2, data["conf"], x0, y0, xd, yd, data["updateTime"], data["state"])
+        track.uuid = uuid.UUID(data["uuid"]) if data["uuid"] else None
+        track.hits = data["hits"]
+        if data["history"]:
+            track.history = TrackHistory(*data["history"][0])
+            for point in data["history"][1:]:
+                track.history.append(*point)
+        else:
+            track.history = None
+        return track
+
+def containedDetections(boxes, confs, zones):
+    # Of two detections in the same zone where one box contains the other keep
+    # the more confident one (the earlier one on a tie). Returns a keep mask.
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    contains = ((x1[:, None] <= x1[None, :]) & (y1[:, None] <= y1[None, :]) &
+                (x2[:, None] >= x2[None, :]) & (y2[:, None] >= y2[None, :]))
+    overlapping = (contains | contains.T) & (zones[:, None] == zones[None, :])
+    np.fill_diagonal(overlapping, False)
+    order = np.arange(len(confs))
+    stronger = (confs[:, None] > confs[None, :]) | ((confs[:, None] == confs[None, :]) & (order[:, None] < order[None, :]))
+    return ~(overlapping & stronger).any(axis=0)
+def getWidthHeight(x1, y1, x2, y2):
+    width = x2 - x1
+    height = y2 - y1
+    return (width, height)
+def getCenterPos(x1, y1, x2, y2):
+    center_x = (x1 + x2) // 2
+    center_y = (y1 + y2) // 2
+    return (center_x, center_y)
+
+# Per-camera zone geometry, keyed by camera id (websocket path). Cameras that are
+# not listed here use STAGING_AREA_BOUNDS.
+CAMERA_STAGING_AREAS = {
+    # "Camera02": [(150, 230), (340, 100), (590, 270), (450, 638)],
+}
+
+ZONE_RACK_SIDE = 0
+ZONE_STAGING = 1
+ZONE_DOOR_SIDE = 2
+CAMERA_ZONES_FILE = "camera_zones.json" # {"Camera02": {"staging_area": [[x, y], [x, y], [x, y], [x, y]]}}
+ZONE_RELOAD_INTERVAL = 5 # seconds between checks of CAMERA_ZONES_FILE
+# Run the model on every Nth frame, 1 runs it on all of them. A pallet starting
+# from rest has no velocity to predict with, so it must stay within TRACK_GATE
+# over N frames or it starts a new track.
+KEYFRAME_STRIDE = int(os.environ.get("KEYFRAME_STRIDE", "1"))
+KEYFRAME_MAX_INTERVAL = 0.5   # seconds between model runs at most, well inside the 1 s / 3 s tracker timeouts
+KEYFRAME_MIN_CONF = 0.6       # a pallet detected below this makes the next frame a keyframe too
+VELOCITY_SMOOTHING = 0.5      # weight of the newest measured velocity of a track
+MOTION_GATE = os.environ.get("MOTION_GATE", "1") == "1" # skip inference while the staging area and doors are static
+MOTION_SCALE = 4              # frames are compared at FRAME_SIZE / MOTION_SCALE
+MOTION_MARGIN = 40            # pixels around the staging area that count as part of it
+MOTION_THRESHOLD = 25         # gray level change of a moving pixel
+MOTION_MIN_AREA = 0.002       # fraction of the masked pixels that has to change
+MOTION_REFRESH_INTERVAL = 2.0 # seconds, run the model at least this often even on a static scene
+
+def pointsInsidePolygon(xs, ys, polygon):
+    # Even-odd rule: a point is inside when a ray to its right crosses the
+    # polygon edges an odd number of times
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    inside = np.zeros(np.broadcast(xs, ys).shape, dtype=bool)
+    n = len(polygon)
+    for i in range(n):
+        p1x, p1y = polygon[i]
+        p2x, p2y = polygon[(i + 1) % n]
+        crossing = (ys > min(p1y, p2y)) & (ys <= max(p1y, p2y)) & (xs <= max(p1x, p2x))
+        if p1x != p2x:
+            if p1y == p2y:
+                continue
+            xinters = (ys - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
+            crossing &= xs <= xinters
+        inside ^= crossing
+    return inside
+
+class ZoneEngine:
+    # Precomputed geometry of one staging area: a frame-sized zone raster and the
+    # door line / in-out line axes, so a whole frame of pallet centers can be
+    # classified with a few array operations.
+    def __init__(self, bounds, frame_size=(640, 640)):
+        self.bounds = [tuple(point) for point in bounds]
+        self.textPos = (
+            int((self.bounds[1][0] + self.bounds[2][0]) / 2 + 10),
+            int((self.bounds[1][1] + self.bounds[2][1]) / 2 )
+        )
+        self.doorOrigin, self.doorAxisX, self.doorAxisY = self.axes(self.bounds[0], self.bounds[1])
+        self.rackOrigin, self.rackAxisX, self.rackAxisY = self.axes(self.bounds[1], self.bounds[2])
+        width, height = frame_size
+        ys, xs = np.mgrid[0:height, 0:width]
+        self.raster = self.computeZones(xs, ys).astype(np.uint8)
+
+    @staticmethod
+    def axes(origin, x_axis_point):
+        # origin, unit x axis along the line and unit y axis 90 degrees counterclockwise
+        origin = np.array(origin, dtype=np.float64)
+        axis_x = np.array(x_axis_point, dtype=np.float64) - origin
+        axis_x /= np.hypot(axis_x[0], axis_x[1])
+        axis_y = np.array((-axis_x[1], axis_x[0]))
+        return origin, axis_x, axis_y
+
+    @staticmethod
+    def project(xs, ys, origin, axis_x, axis_y):
+        dx = np.asarray(xs, dtype=np.float64) - origin[0]
+        dy = np.asarray(ys, dtype=np.float64) - origin[1]
+        return dx * axis_x[0] + dy * axis_x[1], dx * axis_y[0] + dy * axis_y[1]
+
+    def toDoorFrame(self, xs, ys):
+        return self.project(xs, ys, self.doorOrigin, self.doorAxisX, self.doorAxisY)
+
+    def toRackFrame(self, xs, ys):
+        return self.project(xs, ys, self.rackOrigin, self.rackAxisX, self.rackAxisY)
+
+    def computeZones(self, xs, ys):
+        _, yd = self.toDoorFrame(xs, ys)
+        _, yr = self.toRackFrame(xs, ys)
+        zones = np.where(np.abs(yr) > np.abs(yd), ZONE_DOOR_SIDE, ZONE_RACK_SIDE)
+        return np.where(pointsInsidePolygon(xs, ys, self.bounds), ZONE_STAGING, zones)
+
+    def classify(self, xs, ys):
+        # xs, ys: pallet centers -> zone per center and door-frame coordinates
+        xs = np.asarray(xs)
+        ys = np.asarray(ys)
+        height, width = self.raster.shape
+        in_raster = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        if in_raster.all():
+            zones = self.raster[ys, xs]
+        else:
+            zones = self.computeZones(xs, ys)
+        xd, yd = self.toDoorFrame(xs, ys)
+        return zones, xd, yd
+
+    def region(self, margin=ROI_MARGIN):
+        # Bounding box of the staging area grown by margin, clipped to the frame
+        height, width = self.raster.shape
+        xs = [x for x, _ in self.bounds]
+        ys = [y for _, y in self.bounds]
+        return (max(0, int(min(xs)) - margin), max(0, int(min(ys)) - margin),
+                min(width, int(max(xs)) + margin + 1), min(height, int(max(ys)) + margin + 1))
+
+    def motionMask(self, scale=MOTION_SCALE, margin=MOTION_MARGIN):
+        # Staging area grown by margin plus the door side, where doors open and
+        # pallets are unloaded, downscaled for the motion gate
+        staging = (self.raster == ZONE_STAGING).astype(np.uint8)
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * margin + 1, 2 * margin + 1))
+        mask = cv2.dilate(staging, kernel) | (self.raster == ZONE_DOOR_SIDE)
+        height, width = self.raster.shape
+        return cv2.resize(mask.astype(np.uint8), (width // scale, height // scale), interpolation=cv2.INTER_NEAREST) > 0
+
+zone_engines = {} # bounds -> ZoneEngine, cameras with the same config share the raster
+def getZoneEngine(bounds):
+    key = tuple(tuple(point) for point in bounds)
+    engine = zone_engines.get(key)
+    if engine is None:
+        engine = ZoneEngine(key)
+        zone_engines[key] = engine
+    return engine
+
+class ZoneConfigFile:
+    # Per-camera staging areas loaded from a JSON file and reloaded when it changes
+    def __init__(self, path, reload_interval=ZONE_RELOAD_INTERVAL):
+        self.path = path
+        self.reloadInterval = reload_interval
+        self.mtime = None
+        self.lastCheck = 0
+        self.configs = {}
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def reloadIfChanged(self):
+        current_time = time.time()
+        if current_time - self.lastCheck < self.reloadInterval:
+            return
+        with self.lock:
+            self.lastCheck = current_time
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                mtime = None
+            if mtime == self.mtime:
+                return
+            self.mtime = mtime
+            configs = {}
+            if mtime is not None:
+                try:
+                    with open(self.path) as f:
+                        for camera_id, config in json.load(f).items():
+                            bounds = [tuple(point) for point in config["staging_area"]]
+                            if len(bounds) != 4 or not ValidateyStagingArea(bounds):
+                                print(f"Warning: invalid staging area for {camera_id} in {self.path}, keeping the previous one")
+                                if camera_id in self.configs:
+                                    configs[camera_id] = self.configs[camera_id]
+                                continue
+                            configs[camera_id] = bounds
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    print(f"Error[zone_config]: could not load {self.path}: {e}")
+                    return
+            self.configs = configs
+            self.version += 1
+            print(f"Zone config loaded: {len(configs)} camera(s) from {self.path}")
+
+    def getBounds(self, camera_id):
+        return self.configs.get(camera_id) or CAMERA_STAGING_AREAS.get(camera_id, STAGING_AREA_BOUNDS)
+
+zone_config_file = ZoneConfigFile(CAMERA_ZONES_FILE)
+
+DOOR_MATCH_DISTANCE = 100     # door-line pixels within which a door detection is compared with a known door
+
+class DoorTrack:
+    # One door along the door line. id stays the same for the lifetime of the
+    # door, it is what the Door events report.
+    __slots__ = ("id", "x1", "y1", "x2", "y2", "conf", "width", "height", "x0", "y0", "status",
+                 "validCounts", "isValidated", "updateTime", "isUpdated")
+
+    def __init__(self, door_id, x1, y1, x2, y2, conf, width, height, x0, y0, status, update_time):
+        self.id = door_id
+        self.x1, self.y1, self.x2, self.y2 = x1, y1, x2, y2
+        self.conf = conf
+        self.width, self.height = width, height
+        self.x0, self.y0 = x0, y0 # door-line coordinates of the center
+        self.status = status # True: open
+        self.validCounts = 0
+        self.isValidated = False
+        self.updateTime = update_time
+        self.isUpdated = True
+
+    @property
+    def name(self):
+        return f"Door{self.id}"
+
+    def snapshot(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def fromSnapshot(cls, data):
+        door = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(door, name, data[name])
+        return door
+
+class DoorRegistry:
+    # Doors of one camera kept sorted by their position along the door line, so
+    # a detection finds its door with a bisect. The x intervals of the open
+    # doors are cached for gating door side pallets.
+    def __init__(self):
+        self.doors = []
+        self.keys = [] # door.x0 of self.doors, ascending
+        self.nextId = 0
+        self.openCache = None
+
+    def __len__(self):
+        return len(self.doors)
+
+    def __iter__(self):
+        return iter(self.doors)
+
+    def nearest(self, x0, max_distance=DOOR_MATCH_DISTANCE):
+        # closest door along the door line, None if none is within max_distance
+        index = bisect.bisect_left(self.keys, x0)
+        best, best_distance = None, max_distance
+        for i in (index - 1, index):
+            if 0 <= i < len(self.doors) and abs(self.keys[i] - x0) < best_distance:
+                best, best_distance = self.doors[i], abs(self.keys[i] - x0)
+        return best
+
+    def add(self, x1, y1, x2, y2, conf, width, height, x0, y0, status, update_time):
+        door = DoorTrack(self.nextId, x1, y1, x2, y2, conf, width, height, x0, y0, status, update_time)
+        self.nextId += 1
+        index = bisect.bisect_right(self.keys, x0)
+        self.doors.insert(index, door)
+        self.keys.insert(index, x0)
+        self.openCache = None
+        return door
+
+    def index(self, door, key):
+        # position of door, filed under key; doors with equal keys are told apart by identity
+        index = bisect.bisect_left(self.keys, key)
+        while self.doors[index] is not door:
+            index += 1
+        return index
+
+    def remove(self, door):
+        index = self.index(door, door.x0)
+        del self.doors[index]
+        del self.keys[index]
+        self.openCache = None
+
+    def moved(self, door, previous_x0):
+        # door.x0 changed from previous_x0, move it if it passed a neighbour
+        index = self.index(door, previous_x0)
+        if ((index > 0 and self.keys[index - 1] > door.x0) or
+                (index + 1 < len(self.keys) and self.keys[index + 1] < door.x0)):
+            del self.doors[index]
+            del self.keys[index]
+            index = bisect.bisect_right(self.keys, door.x0)
+            self.doors.insert(index, door)
+            self.keys.insert(index, door.x0)
+        else:
+            self.keys[index] = door.x0
+
+    def changed(self):
+        # status or box of a door changed
+        self.openCache = None
+
+    def snapshot(self):
+        return {"nextId": self.nextId, "doors": [door.snapshot() for door in self.doors]}
+
+    def restore(self, data):
+        self.doors = [DoorTrack.fromSnapshot(door) for door in data["doors"]] # saved in door line order
+        self.keys = [door.x0 for door in self.doors]
+        self.nextId = data["nextId"]
+        self.openCache = None
+
+    def openIntervals(self):
+        # (M, 2) image x1, x2 of the open doors
+        if self.openCache is None:
+            self.openCache = np.array([(door.x1, door.x2) for door in self.doors if door.status],
+                                      dtype=np.float32).reshape(-1, 2)
+        return self.openCache
+
+TRACK_MOVING = ZONE_STAGING
+TRACK_FIXED = 3
+TRACK_REMOVED = -1
+TRACK_STATE_NAMES = {ZONE_RACK_SIDE: "rack_side", TRACK_MOVING: "moving", ZONE_DOOR_SIDE: "door_side", TRACK_FIXED: "fixed"}
+TRACK_HIGH_CONF = 0.6         # detections at or above this are matched first
+TRACK_BIRTH_CONF = MODEL_CONF # unmatched detections at or above this start a track, i.e. all the model keeps
+TRACK_TIMEOUT = 3             # seconds a side track or an unnamed moving track lives without a detection
+TRACK_REST_RADIUS = 5         # pixels, a named pallet whose last TRACK_HISTORY_SIZE centers stay this close is fixed
+TRACK_REID_MIN_HITS = 5       # an unnamed moving track takes over the uuid of a lost one after this many detections
+TRACK_REID_MIN_IDLE = 1       # seconds without a detection before a named moving track counts as lost
+TRACK_REID_DISTANCE = 1000
+# zone a pallet comes from / goes to -> DocCat, DocType, comments, palletStatus
+TRACK_ENTER_EVENTS = {ZONE_DOOR_SIDE: ("Dock", "UOD", "Dock Unload", "unload state"),
+                      ZONE_RACK_SIDE: ("Stage", "IN", "Stage In", "in state")}
+TRACK_EXIT_EVENTS = {ZONE_DOOR_SIDE: ("Dock", "LOD", "Dock Load", "load state"),
+                     ZONE_RACK_SIDE: ("Stage", "Out", "Stage Out", "out state")}
+
+class PalletTracker:
+    # SORT/ByteTrack style pallet tracker. Every pallet is one PalletTrack whose
+    # state is the zone it was last seen in. Detections are matched to the
+    # constant-velocity predictions of all tracks at once, the confident ones
+    # first and the weak ones only to the tracks left over. A pallet gets its
+    # uuid when it enters the staging area from a side (UOD / IN) and keeps it
+    # until it leaves to a side again (LOD / Out).
+    def __init__(self, camera_id=None):
+        self.cameraId = camera_id
+        self.tracks = []
+        self.unmatched = 0 # births and missed moving tracks of the last update
+
+    def reset(self):
+        self.tracks = []
+        self.unmatched = 0
+
+    def snapshot(self):
+        return [track.snapshot() for track in self.tracks]
+
+    def restore(self, tracks):
+        self.tracks = [PalletTrack.fromSnapshot(track) for track in tracks]
+
+    def counts(self):
+        counts = dict.fromkeys(TRACK_STATE_NAMES.values(), 0)
+        for track in self.tracks:
+            counts[TRACK_STATE_NAMES[track.state]] += 1
+        return counts
+
+    def update(self, boxes, confs, centers, zones, door_coords, now, gate=TRACK_GATE):
+        # boxes (N, 4), confs (N,), centers (N, 2), zones (N,), door_coords (N, 2) of
+        # the pallet detections of one frame. Returns the events as
+        # (DocCat, DocType, uuid, comments, palletStatus).
+        events = []
+        with frame_tracer.span("associate", self.cameraId):
+            matches = self.associate(centers, confs, now, gate)
+        with frame_tracer.span("transitions", self.cameraId):
+            for i, j in sorted(matches.items()):
+                track = self.tracks[i]
+                if track.state != TRACK_REMOVED:
+                    self.transition(track, boxes[j].tolist(), float(confs[j]), centers[j].tolist(),
+                                    door_coords[j].tolist(), int(zones[j]), now, events)
+            matched = set(matches.values())
+            self.unmatched = sum(1 for i, track in enumerate(self.tracks) if i not in matches and track.state == TRACK_MOVING)
+            for j in np.flatnonzero(confs >= TRACK_BIRTH_CONF).tolist():
+                if j not in matched:
+                    self.unmatched += 1
+                    x1, y1, x2, y2 = boxes[j].tolist()
+                    (x0, y0), (xd, yd) = centers[j].tolist(), door_coords[j].tolist()
+                    self.tracks.append(PalletTrack(x1, y1, x2, y2, float(confs[j]), x0, y0, xd, yd, now, int(zones[j])))
+        with frame_tracer.span("lost", self.cameraId):
+            self.reidentify(now)
+            self.tracks = [track for track in self.tracks
+                           if track.state != TRACK_REMOVED and not self.expired(track, now)]
+        return events
+
+    def associate(self, centers, confs, now, gate):
+        # Two stages: confident detections against all tracks, then the weak
+        # detections against the tracks that are still unmatched.
+        predicted = palletCenters(self.tracks, now)
+        gates = self.gates(now, gate)
+        matches = {}
+        for stage in (np.flatnonzero(confs >= TRACK_HIGH_CONF), np.flatnonzero(confs < TRACK_HIGH_CONF)):
+            free = np.array([i for i in range(len(self.tracks)) if i not in matches], dtype=np.int64)
+            if not len(free) or not len(stage):
+                continue
+            found = matchDistances(pointDistances(predicted[free], centers[stage]), gates[free])
+            matches.update({int(free[i]): int(stage[j]) for i, j in found.items()})
+        return matches
+
+    def gates(self, now, gate):
+        # Match radius per track around its predicted center: gate for fixed
+        # pallets and tracks without a measured velocity, widened for moving
+        # ones by how far the constant-velocity prediction may be off
+        speeds = np.array([np.hypot(track.vx, track.vy) if track.state != TRACK_FIXED else 0.0
+                           for track in self.tracks], dtype=np.float64)
+        elapsed = np.array([min(now - track.updateTime, KEYFRAME_MAX_INTERVAL) for track in self.tracks], dtype=np.float64)
+        return gate + TRACK_PREDICTION_ERROR * speeds * np.maximum(elapsed, 0)
+
+    def transition(self, track, box, conf, center, door_coord, zone, now, events):
+        previous = track.state
+        if previous in (ZONE_DOOR_SIDE, ZONE_RACK_SIDE) and zone == ZONE_STAGING:
+            # enters the staging area and gets its uuid; a pallet that already
+            # left with LOD / Out and comes straight back is not announced again
+            if track.uuid is None:
+                track.uuid = uuid.uuid4()
+                events.append(TRACK_ENTER_EVENTS[previous][:2] + (track.uuid,) + TRACK_ENTER_EVENTS[previous][2:])
+            else:
+                track.uuid = None
+            track.history = TrackHistory(track.x0, track.y0)
+            track.state = TRACK_MOVING
+            track.update(*box, conf, *center, *door_coord, now)
+        elif previous in (TRACK_MOVING, TRACK_FIXED) and zone != ZONE_STAGING:
+            # leaves the staging area
+            if track.uuid is None:
+                self.borrowUuid(track, now, 0)
+            if track.uuid is not None:
+                events.append(TRACK_EXIT_EVENTS[zone][:2] + (track.uuid,) + TRACK_EXIT_EVENTS[zone][2:])
+            track.history = None
+            track.state = zone
+            track.update(*box, conf, *center, *door_coord, now)
+        elif previous in (TRACK_MOVING, TRACK_FIXED):
+            was_full = track.history.isFull()
+            track.update(*box, conf, *center, *door_coord, now)
+            track.history.append(track.x0, track.y0)
+            if previous == TRACK_MOVING and was_full and track.uuid is not None and track.history.maxDeviation() < TRACK_REST_RADIUS:
+                track.state = TRACK_FIXED
+            elif previous == TRACK_FIXED and np.hypot(*(track.history.ordered()[0] - center)) >= TRACK_REST_RADIUS:
+                track.state = TRACK_MOVING # picked up
+        else:
+            track.state = zone
+            track.update(*box, conf, *center, *door_coord, now)
+
+    def borrowUuid(self, track, now, min_idle):
+        # Hand the uuid of the nearest named moving track that has not been seen
+        # for min_idle seconds to track and drop that one, it was a duplicate of
+        # the same pallet.
+        candidates = [other for other in self.tracks
+                      if other is not track and other.state == TRACK_MOVING and other.uuid is not None
+                      and now - other.updateTime >= min_idle]
+        if not candidates:
+            return False
+        distances = pointDistances(palletCenters([track]), palletCenters(candidates))[0]
+        nearest = int(np.argmin(distances))
+        if distances[nearest] >= TRACK_REID_DISTANCE:
+            return False
+        track.uuid = candidates[nearest].uuid
+        candidates[nearest].state = TRACK_REMOVED
+        return True
+
+    def reidentify(self, now):
+        for track in self.tracks:
+            if track.state == TRACK_MOVING and track.uuid is None and track.hits > TRACK_REID_MIN_HITS:
+                self.borrowUuid(track, now, TRACK_REID_MIN_IDLE)
+
+    @staticmethod
+    def expired(track, now):
+        # named pallets in the staging area are kept while they are not seen
+        if track.state in (TRACK_MOVING, TRACK_FIXED) and track.uuid is not None:
+            return False
+        return now - track.updateTime > TRACK_TIMEOUT
+
+class MotionGate:
+    # Cheap frame differencing inside the zone mask against the last frame that
+    # went through the model. Static frames reuse the detections of that frame,
+    # so tracks keep being refreshed and the tracker timeouts behave as before;
+    # the model still runs every MOTION_REFRESH_INTERVAL seconds.
+    def __init__(self, scale=MOTION_SCALE, threshold=MOTION_THRESHOLD, min_area=MOTION_MIN_AREA, refresh_interval=MOTION_REFRESH_INTERVAL):
+        self.scale = scale
+        self.threshold = threshold
+        self.minArea = min_area
+        self.refreshInterval = refresh_interval
+        self.zones = None
+        self.mask = None
+        self.minPixels = 0
+        self.reset()
+
+    def reset(self):
+        self.reference = None # downscaled gray frame of the last inference
+        self.referenceTime = None
+        self.detections = None
+
+    def small(self, frame):
+        height, width = frame.shape[:2]
+        gray = cv2.cvtColor(cv2.resize(frame, (width // self.scale, height // self.scale), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def check(self, frame, zones, capture_time):
+        # Returns (cached detections, None) for a static frame, else (None, small frame)
+        small = self.small(frame)
+        if zones is not self.zones:
+            self.zones = zones
+            self.mask = zones.motionMask(self.scale)
+            self.minPixels = max(1, int(self.mask.sum() * self.minArea))
+            self.reset()
+        if (self.detections is None or self.reference.shape != small.shape
+                or capture_time - self.referenceTime >= self.refreshInterval):
+            return None, small
+        changed = (cv2.absdiff(small, self.reference) > self.threshold) & self.mask
+        if np.count_nonzero(changed) >= self.minPixels:
+            return None, small
+        return self.detections, None
+
+    def update(self, small, detections, capture_time):
+        self.reference = small
+        self.referenceTime = capture_time
+        self.detections = detections
+
+class FrameSlot:
+    # Latest-value slot: put() overwrites whatever is still waiting, get() returns
+    # the newest frame that is not older than max_age and skips the rest.
+    def __init__(self, max_age=MAX_FRAME_AGE, clock=time.time):
+        self.maxAge = max_age
+        self.clock = clock
+        self.value = None # (message, capture_time)
+        self.ready = asyncio.Event()
+        self.overwritten = 0
+        self.stale = 0
+
+    def put(self, message, capture_time):
+        if self.value is not None:
+            self.overwritten += 1
+        self.value = (message, capture_time)
+        self.ready.set()
+
+    async def get(self):
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            message, capture_time = self.value
+            self.value = None
+            if self.clock() - capture_time > self.maxAge:
+                self.stale += 1
+                continue
+            return message, capture_time
+
+TRACKER_SNAPSHOT_PATH = "tracker_snapshots.db"
+TRACKER_SNAPSHOT_INTERVAL = float(os.environ.get("TRACKER_SNAPSHOT_INTERVAL", "2.0")) # seconds between snapshots per camera, 0 disables them
+TRACKER_SNAPSHOT_MAX_AGE = float(os.environ.get("TRACKER_SNAPSHOT_MAX_AGE", "60.0")) # seconds, older snapshots are not restored
+
+class TrackerSnapshots:
+    # Latest pallet and door tracker state of every camera in SQLite (WAL), one
+    # row per camera overwritten every TRACKER_SNAPSHOT_INTERVAL seconds. A
+    # camera that reconnects, or connects after a restart, picks up its named
+    # pallets and doors from here instead of announcing them again.
+    def __init__(self, path=TRACKER_SNAPSHOT_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = None
+        self.saves = 0
+
+    def open(self):
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS snapshots (
+            camera_id TEXT PRIMARY KEY,
+            saved REAL NOT NULL,
+            state TEXT NOT NULL)""")
+
+    def save(self, camera_id, saved, state):
+        if self.db is None:
+            return
+        payload = json.dumps(state, default=lambda value: value.item()) # numpy scalars
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO snapshots (camera_id, saved, state) VALUES (?, ?, ?)",
+                            (camera_id, saved, payload))
+            self.saves += 1
+
+    def load(self, camera_id):
+        # (state, saved time) or (None, None)
+        if self.db is None:
+            return None, None
+        with self.lock:
+            row = self.db.execute("SELECT state, saved FROM snapshots WHERE camera_id = ?", (camera_id,)).fetchone()
+        if row is None:
+            return None, None
+        return json.loads(row[0]), row[1]
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+tracker_snapshots = TrackerSnapshots()
+
+class CameraSession:
+    # Owns the tracker state, frame queue and zone geometry of one camera so that
+    # a single loaded model can serve several websocket connections.
+    def __init__(self, camera_id, clock=time.time, send_event=None, snapshots=None, archiver=None):
+        self.cameraId = camera_id
+        self.clock = clock # tracker time source, replaced by a replay clock offline
+        self.sendEvent = send_event or sendPostData
+        self.snapshots = snapshots if TRACKER_SNAPSHOT_INTERVAL > 0 else None # TrackerSnapshots, None: never saved
+        self.snapshotTime = float("-inf")
+        self.snapshotDirty = False # frames were tracked since the last snapshot
+        self.archiver = archiver # FrameArchiver, None: frames are not saved
+        self.zones = None
+        self.zonesVersion = -1
+        self.refreshZones()
+        self.frameSlot = FrameSlot() # latest compressed frame, older ones are overwritten
+        self.decodeFlags = cv2.IMREAD_COLOR # reduced-resolution JPEG decode once the source size is known
+        self.framesReceived = 0
+        self.framesDecoded = 0
+        self.framesTracked = 0
+        self.frameTime = clock() # capture time of the frame being tracked
+        self.motionGate = MotionGate() if MOTION_GATE else None
+        self.palletTracker = PalletTracker(camera_id)
+        self.roiRefreshTime = float("-inf") # last whole-frame inference in ROI mode
+        self.framesPropagated = 0 # frames between keyframes, tracks only predicted
+        self.framesGated = 0 # frames that reused the previous detections
+        self.framesRejected = 0 # frames turned away while the model was loading
+        self.framesLost = 0 # gaps in the sequence numbers of framed senders
+        self.framesOutOfOrder = 0 # duplicate or late framed messages, dropped
+        self.receivedRate = RateMeter()
+        self.processedRate = RateMeter()
+        self.displayFrame = None
+        self.processorTask = None
+        self.connections = 0
+        self.viewers = 0 # open preview streams/snapshots of this camera
+        self.objectForklift = None # x1, y1, x2, y2, conf, width, height, center_x, center_y
+        self.resetObjects()
+
+    def isWatched(self):
+        # Annotating frames is only worth it when someone looks at them
+        return self.viewers > 0 or not HEADLESS
+
+    def refreshZones(self):
+        # Pick up edits of CAMERA_ZONES_FILE without restarting the session
+        zone_config_file.reloadIfChanged()
+        if self.zonesVersion != zone_config_file.version:
+            self.zones = getZoneEngine(zone_config_file.getBounds(self.cameraId))
+            self.zonesVersion = zone_config_file.version
+
+    def drawStagingArea(self, frame):
+        with stage_seconds.time("drawStagingArea", self.cameraId):
+            self.drawZones(frame)
+
+    def drawZones(self, frame):
+        points = np.array(self.zones.bounds, dtype=np.int32)
+        cv2.polylines(frame, [points], isClosed=True, color=COLOR_RED, thickness=LINE_WIDTH)
+        
+        # Add label for the quadrilateral area
+        cv2.putText(frame, "STAGING AREA", self.zones.textPos,
+                    G_FONT, G_FONT_SCALE, COLOR_RED, LINE_WIDTH)
+                    
+        cv2.putText(frame, self.doorStatus, (10, 30),
+                    G_FONT, G_FONT_SCALE, COLOR_GREEN, LINE_WIDTH)
+
+        cv2.putText(frame, self.palletStatus, (10, 50),
+                    G_FONT, G_FONT_SCALE, COLOR_GREEN, LINE_WIDTH)
+
+    # objectDoors: DoorRegistry of DoorTrack
+    # palletTracker.tracks: PalletTrack, one per pallet
+    def validateDoors(self):
+        #print(f"door status: {self.doorStatus}")
+        # if isValidated is false and updateTime is over 3 seconds, remove these doors from self.objectDoors
+        current_time = self.frameTime
+        for door in list(self.objectDoors):
+            if not door.isValidated and current_time - door.updateTime > 3:
+                self.objectDoors.remove(door)
+            elif door.validCounts > 2:
+                door.validCounts = 2
+                door.isValidated = True
+                if door.isUpdated == False:
+                    door_status = "Open" if door.status else "Close"
+                    self.doorStatus = f"{door.name}: {door_status}"
+                    self.sendEvent("Door", door_status, None, door.name, f"Door {door_status}", self.cameraId)
+                    door.isUpdated = True
+                    break
+
+    def updateDoorStatus(self, boxes, confs):
+        # boxes: (N, 4) int array of x1, y1, x2, y2, confs: (N,) array
+        if len(boxes) == 0:
+            return
+        widths, heights = getWidthHeight(boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3])
+        centers_x, centers_y = getCenterPos(boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3])
+        door_xs, door_ys = self.zones.toDoorFrame(centers_x, centers_y)
+        for (x1, y1, x2, y2), conf, w, h, x0, y0 in zip(boxes.tolist(), confs.tolist(), widths.tolist(),
+                                                        heights.tolist(), door_xs.tolist(), door_ys.tolist()):
+            status = abs(y0) > h
+            door = self.objectDoors.nearest(x0)
+            if door is not None and abs(door.x0 - x0) < door.width / 2: # exist door
+                previous_x0 = door.x0
+                if door.status == status: # same status
+                    door.x0 = x0
+                    door.y0 = y0
+                    door.validCounts += 1
+                    door.updateTime = self.frameTime
+                else: # new status
+                    door.x1, door.y1, door.x2, door.y2 = x1, y1, x2, y2
+                    door.conf = conf
+                    door.width, door.height = w, h
+                    door.x0, door.y0 = x0, y0
+                    door.status = status
+                    door.validCounts = 0
+                    door.updateTime = self.frameTime
+                    door.isUpdated = not door.isUpdated
+                    self.objectDoors.changed()
+                self.objectDoors.moved(door, previous_x0)
+            else: # new door
+                self.objectDoors.add(x1, y1, x2, y2, conf, w, h, x0, y0, status, self.frameTime)
+
+    def processDoors(self, boxes, confs):
+        self.updateDoorStatus(boxes, confs)
+        self.validateDoors()
+
+
+
+    
+    def validatePallets(self, boxes, confs):
+        # boxes: (N, 4) int array of x1, y1, x2, y2, confs: (N,) array
+        # Door side pallets only count below an open door; of nested boxes in
+        # one zone only the most confident is kept.
+        centers = np.stack(getCenterPos(boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]), axis=1)
+        zones, xd, yd = self.zones.classify(centers[:, 0], centers[:, 1])
+        open_doors = self.objectDoors.openIntervals()
+        below_open_door = ((open_doors[None, :, 0] < centers[:, 0, None]) & (centers[:, 0, None] < open_doors[None, :, 1])).any(axis=1)
+        keep = (zones != ZONE_DOOR_SIDE) | below_open_door
+        boxes, confs, centers, zones = boxes[keep], confs[keep], centers[keep], zones[keep]
+        door_coords = np.stack((xd[keep], yd[keep]), axis=1)
+        keep = containedDetections(boxes, confs, zones)
+        self.palletDetections = (boxes[keep], confs[keep], centers[keep], zones[keep], door_coords[keep])
+
+    def resetObjects(self):
+        self.palletTracker.reset()
+        self.palletDetections = None
+        self.objectDoors = DoorRegistry()
+        if self.motionGate is not None:
+            self.motionGate.reset()
+        self.roiRefreshTime = float("-inf") # find the doors again on the whole frame
+        self.keyframeTime = float("-inf")
+        self.framesSinceKeyframe = 0
+        self.keyframeUncertain = True
+        self.keyframePallets = -1
+        self.doorStatus = "Init"
+        self.palletStatus = "Reset"
+
+    def snapshotState(self):
+        return {"tracks": self.palletTracker.snapshot(), "doors": self.objectDoors.snapshot(),
+                "doorStatus": self.doorStatus, "palletStatus": self.palletStatus}
+
+    def saveSnapshot(self):
+        if self.snapshots is None:
+            return
+        with stage_seconds.time("snapshot", self.cameraId):
+            self.snapshots.save(self.cameraId, self.frameTime, self.snapshotState())
+        self.snapshotTime = self.frameTime
+        self.snapshotDirty = False
+
+    def resumeObjects(self):
+        # On connect. A session that is still connected (after a network blip
+        # the old socket only goes at the ping timeout) or that has tracked
+        # frames since the last snapshot carries on with its state in memory.
+        # Otherwise, e.g. after a restart, it is reset and restored from the
+        # snapshot if that is at most TRACKER_SNAPSHOT_MAX_AGE seconds old.
+        if self.connections > 0:
+            return False
+        state, saved = self.snapshots.load(self.cameraId) if self.snapshots is not None else (None, None)
+        if self.framesTracked and (state is None or saved <= self.frameTime):
+            age = self.clock() - self.frameTime
+            if age <= TRACKER_SNAPSHOT_MAX_AGE:
+                return False
+            print(f"{self.cameraId}: tracker state is {age:.0f} s old, starting empty")
+            self.resetObjects()
+            return False
+        self.resetObjects()
+        if state is None:
+            return False
+        age = self.clock() - saved
+        if age > TRACKER_SNAPSHOT_MAX_AGE:
+            print(f"{self.cameraId}: tracker snapshot is {age:.0f} s old, starting empty")
+            return False
+        self.palletTracker.restore(state["tracks"])
+        self.objectDoors.restore(state["doors"])
+        self.doorStatus = state["doorStatus"]
+        self.palletStatus = state["palletStatus"]
+        print(f"{self.cameraId}: restored {len(self.palletTracker.tracks)} pallets and {len(self.objectDoors)} doors "
+              f"from a snapshot {age:.1f} s old")
+        return True
+
+    def processPallets(self):
+        if self.palletDetections is None:
+            return
+        events = self.palletTracker.update(*self.palletDetections, self.frameTime)
+        self.palletDetections = None
+        for doc_cat, doc_type, pallet_id, comments, pallet_status in events:
+            self.sendEvent(doc_cat, doc_type, pallet_id, None, comments, self.cameraId)
+            if self.archiver is not None and doc_type in ARCHIVE_EVENT_TYPES:
+                self.archiver.trigger(self.cameraId, f"{doc_type}_{str(pallet_id)[:8]}")
+            self.palletStatus = pallet_status
+            print(f"========={self.palletStatus}")
+
+    def processForklift(self, boxes, confs):
+        # cv2.rectangle(frame, (x1, y1), (x2, y2), (190, 0, 190), 2)
+        if len(boxes) == 0:
+            return
+        best = int(np.argmax(confs))
+        x1, y1, x2, y2 = boxes[best].tolist()
+        w, h = getWidthHeight(x1, y1, x2, y2)
+        x0, y0 = getCenterPos(x1, y1, x2, y2)
+        self.objectForklift = {"x1":x1, "y1":y1, "x2":x2, "y2":y2, "conf": float(confs[best]), "width":w, "height":h, "x0":x0, "y0":y0}
+    def inferenceInput(self, frame, capture_time):
+        # In ROI mode the model only sees the box around the staging area and the
+        # tracked doors, plus ROI_MARGIN; every ROI_REFRESH_INTERVAL it sees the
+        # whole frame so new doors are found. Returns the image and its (x, y)
+        # offset in the frame, None for the whole frame.
+        if not INFERENCE_ROI:
+            return frame, None
+        if capture_time - self.roiRefreshTime >= ROI_REFRESH_INTERVAL:
+            self.roiRefreshTime = capture_time
+            return frame, None
+        x1, y1, x2, y2 = self.zones.region()
+        height, width = frame.shape[:2]
+        for door in self.objectDoors:
+            x1 = min(x1, max(0, int(door.x1) - ROI_MARGIN))
+            y1 = min(y1, max(0, int(door.y1) - ROI_MARGIN))
+            x2 = max(x2, min(width, int(door.x2) + ROI_MARGIN))
+            y2 = max(y2, min(height, int(door.y2) + ROI_MARGIN))
+        return frame[y1:y2, x1:x2], (x1, y1)
+
+    @staticmethod
+    def toFrameSpace(detections, offset):
+        # Boxes of a cropped model input -> frame coordinates
+        if offset is None or not len(detections):
+            return detections
+        detections = detections.copy()
+        detections[:, [0, 2]] += offset[0]
+        detections[:, [1, 3]] += offset[1]
+        return detections
+
+    def processDetections(self, frame, detections, capture_time=None, draw=True):
+        # detections: (N, 6) array of x1, y1, x2, y2, conf, class as returned by runInference
+        # capture_time: when the frame was taken, the tracker ages tracks by it instead of by processing time
+        # draw: annotate the frame with the detection boxes
+        self.frameTime = self.clock() if capture_time is None else capture_time
+        self.framesTracked += 1
+        self.refreshZones()
+        boxes = detections[:, :4].astype(np.int32)
+        confs = detections[:, 4]
+        class_ids = detections[:, 5].astype(np.int32)
+        pallet_mask = class_ids == CLASS_PALLET
+        door_mask = class_ids == CLASS_DOOR
+        forklift_mask = class_ids == CLASS_FORKLIFT
+        other_mask = ~(pallet_mask | door_mask | forklift_mask)
+
+        self.validatePallets(boxes[pallet_mask], confs[pallet_mask])
+        if draw:
+            for x1, y1, x2, y2 in boxes[pallet_mask].tolist():
+                cv2.rectangle(frame, (x1, y1), (x2, y2), COLOR_PALLET, LINE_WIDTH)
+            for x1, y1, x2, y2 in boxes[other_mask].tolist():
+                # Draw bounding box
+                cv2.rectangle(frame, (x1, y1), (x2, y2), COLOR_BLACK, LINE_WIDTH)
+        with stage_seconds.time("processDoors", self.cameraId):
+            self.processDoors(boxes[door_mask], confs[door_mask])
+        with stage_seconds.time("processPallets", self.cameraId):
+            self.processPallets()
+        self.snapshotDirty = True
+        if self.snapshots is not None and self.frameTime - self.snapshotTime >= TRACKER_SNAPSHOT_INTERVAL:
+            self.saveSnapshot()
+        # self.processForklift(boxes[forklift_mask], confs[forklift_mask])
+
+    def queueFrame(self, message, capture_time):
+        # Keep only the newest message, an older one still waiting is never decoded
+        self.framesReceived += 1
+        self.receivedRate.tick()
+        self.frameSlot.put(message, capture_time)
+
+    @property
+    def framesDropped(self):
+        return self.frameSlot.overwritten
+
+    @property
+    def framesStale(self):
+        return self.frameSlot.stale
+
+    def checkMotion(self, frame, capture_time):
+        with stage_seconds.time("motion", self.cameraId):
+            return self.motionGate.check(frame, self.zones, capture_time)
+
+    def decodeFrame(self, message):
+        with stage_seconds.time("decode", self.cameraId):
+            frame, source_size = decodeFrame(message, self.decodeFlags)
+        if frame is None:
+            return None
+        self.framesDecoded += 1
+        self.decodeFlags = reducedDecodeFlags(source_size)
+        return frame
+
+    def isKeyframe(self, capture_time):
+        # Adaptive stride: the model runs on every KEYFRAME_STRIDE-th frame, at least
+        # every KEYFRAME_MAX_INTERVAL and on every frame while the detections are uncertain
+        return (KEYFRAME_STRIDE <= 1 or self.keyframeUncertain
+                or self.framesSinceKeyframe + 1 >= KEYFRAME_STRIDE
+                or capture_time - self.keyframeTime >= KEYFRAME_MAX_INTERVAL)
+
+    def keyframeDone(self, detections, capture_time):
+        # Uncertain: a weak pallet detection, pallets appeared / disappeared or
+        # the tracker started or missed a track, whose velocity is then unknown
+        pallet_confs = detections[detections[:, 5] == CLASS_PALLET, 4]
+        self.keyframeUncertain = (len(pallet_confs) != self.keyframePallets or bool((pallet_confs < KEYFRAME_MIN_CONF).any())
+                                  or self.palletTracker.unmatched > 0)
+        self.keyframePallets = len(pallet_confs)
+        self.keyframeTime = capture_time
+        self.framesSinceKeyframe = 0
+
+    async def processKeyframe(self, message, capture_time):
+        frame = await asyncio.to_thread(self.decodeFrame, message)
+        if frame is None:
+            print(f"Warning: Received empty or corrupt frame from {self.cameraId}.")
+            return
+        detections, small = None, None
+        if self.motionGate is not None:
+            detections, small = await asyncio.to_thread(self.checkMotion, frame, capture_time)
+        if detections is not None:
+            self.framesGated += 1
+        else:
+            image, offset = self.inferenceInput(frame, capture_time)
+            detections = await inference_scheduler.infer(image, capture_time)
+            if detections is None: # dropped, too old
+                return
+            detections = self.toFrameSpace(detections, offset)
+            if small is not None:
+                self.motionGate.update(small, detections, capture_time)
+        watched = self.isWatched()
+        if self.archiver is not None:
+            # archived without the boxes, whether or not someone is watching
+            self.archiver.offer(self.cameraId, frame.copy() if watched else frame, capture_time)
+        await asyncio.to_thread(self.processDetections, frame, detections, capture_time, watched)
+        self.keyframeDone(detections, capture_time)
+        if watched:
+            await asyncio.to_thread(self.drawStagingArea, frame)
+            self.displayFrame = frame
+        self.processedRate.tick()
+
+    async def processPropagatedFrame(self, message, capture_time):
+        # No model run and no tracker update, so no state changes between
+        # keyframes; the frame is only decoded to show the predicted tracks.
+        self.framesSinceKeyframe += 1
+        self.framesPropagated += 1
+        if self.isWatched():
+            frame = await asyncio.to_thread(self.decodeFrame, message)
+            if frame is not None:
+                await asyncio.to_thread(self.drawPredictions, frame, capture_time)
+                await asyncio.to_thread(self.drawStagingArea, frame)
+                self.displayFrame = frame
+        self.processedRate.tick()
+
+    def drawPredictions(self, frame, at_time):
+        for track in self.palletTracker.tracks:
+            x1, y1, x2, y2 = track.predictBox(at_time)
+            cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), COLOR_PALLET, LINE_WIDTH)
+        for door in self.objectDoors:
+            cv2.rectangle(frame, (int(door.x1), int(door.y1)), (int(door.x2), int(door.y2)), COLOR_BLACK, LINE_WIDTH)
+
+    async def frameProcessor(self):
+        while True:
+            message, capture_time = await self.frameSlot.get()
+            try:
+                with frame_tracer.span("frame", self.cameraId):
+                    if self.isKeyframe(capture_time):
+                        await self.processKeyframe(message, capture_time)
+                    else:
+                        await self.processPropagatedFrame(message, capture_time)
+                frame_tracer.frameDone()
+            except Exception as e:
+                print(f"Error[frame_processor:{self.cameraId}]: {e}")
+
+def inferenceWorker(index, shm_name, slot_bytes, conn, threads, cpus):
+    # Worker process main: loads its own model, then answers batches whose
+    # frames were written to its shared memory slots with the detections only.
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    torch.set_num_threads(threads)
+    shm = shared_memory.SharedMemory(name=shm_name) # unlinked by the parent
+    try:
+        backend = createInferenceBackend(input_size=MODEL_INFERENCE_SIZE)
+        warmUpBackend(backend, MODEL_INFERENCE_SIZE)
+        conn.send(backend.names)
+        while True:
+            shapes = conn.recv()
+            if shapes is None:
+                break
+            frames = [np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=i * slot_bytes)
+                      for i, shape in enumerate(shapes)]
+            try:
+                detections = [np.ascontiguousarray(det, dtype=np.float32) for det in backend.infer(frames)]
+                conn.send(detections)
+            except Exception as e:
+                conn.send(RuntimeError(f"worker {index}: {e}"))
+            del frames
+    except (KeyboardInterrupt, EOFError):
+        pass
+    finally:
+        shm.close()
+
+class InferenceWorkerPool:
+    # The model in separate processes, each with its own GIL and torch thread
+    # pool. Every worker owns a ring of INFERENCE_BATCH_SIZE frame slots in
+    # shared memory: a batch is copied into the slots once, only the frame
+    # shapes go down the pipe and only the (N, 6) detection arrays come back.
+    def __init__(self, workers=INFERENCE_WORKERS, threads=WORKER_TORCH_THREADS, affinity=WORKER_CPU_AFFINITY,
+                 slots=INFERENCE_BATCH_SIZE):
+        self.size = workers
+        cores = os.cpu_count() or 1
+        self.threads = threads or max(1, cores // workers)
+        self.affinity = affinity
+        self.slots = slots
+        self.slotBytes = FRAME_SIZE * FRAME_SIZE * 3
+        self.workers = [] # (process, connection, shared memory), None while a dead one awaits its replacement
+        self.idle = queue.Queue()
+        self.names = {}
+        self.context = None
+        self.cores = []
+
+    def start(self):
+        self.context = multiprocessing.get_context("spawn") # forking a process that already runs torch threads can hang
+        self.cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+        self.workers = [self.spawn(index) for index in range(self.size)]
+        for index in range(self.size):
+            try:
+                self.names = self.workers[index][1].recv()
+            except EOFError:
+                self.close()
+                raise RuntimeError(f"inference worker {index} exited while loading the model")
+            self.idle.put(index)
+        setModelClasses(self.names)
+        print(f"Inference workers: {self.size} processes, {self.threads} torch threads each"
+              + (", pinned to cores" if self.affinity and self.cores else ""))
+
+    def spawn(self, index):
+        # Starts worker index with a fresh shared memory block, it reports the
+        # class names on its pipe once its model is loaded
+        cpus = None
+        if self.affinity and self.cores:
+            first = index * self.threads % len(self.cores)
+            cpus = set(self.cores[first:first + self.threads]) or None
+        shm = shared_memory.SharedMemory(create=True, size=self.slots * self.slotBytes)
+        conn, worker_conn = self.context.Pipe()
+        process = self.context.Process(target=inferenceWorker, name=f"inference-worker-{index}", daemon=True,
+                                       args=(index, shm.name, self.slotBytes, worker_conn, self.threads, cpus))
+        process.start()
+        worker_conn.close()
+        return process, conn, shm
+
+    def respawn(self, index):
+        # Replaces a dead worker, blocks until the new one has loaded the model
+        if self.workers[index] is not None:
+            self.retire(*self.workers[index])
+            self.workers[index] = None
+        print(f"Warning: inference worker {index} died, restarting it.")
+        worker = self.spawn(index)
+        try:
+            worker[1].recv()
+        except EOFError:
+            self.retire(*worker)
+            raise RuntimeError(f"inference worker {index} exited while loading the model")
+        self.workers[index] = worker
+
+    def retire(self, process, conn, shm, timeout=5):
+        process.join(timeout=timeout)
+        if process.is_alive():
+            process.terminate()
+            process.join(timeout=1)
+        conn.close()
+        shm.close()
+        shm.unlink()
+
+    def infer(self, frames):
+        # Blocks the calling thread until an idle worker has run the batch. A
+        # worker that died is dropped with its shared memory and the batch
+        # fails; the next batch to get its index starts a new one.
+        index = self.idle.get()
+        try:
+            if self.workers[index] is None or not self.workers[index][0].is_alive():
+                self.respawn(index)
+            _, conn, shm = self.workers[index]
+            shapes = []
+            for i, frame in enumerate(frames):
+                if i >= self.slots or frame.nbytes > self.slotBytes:
+                    raise ValueError(f"batch does not fit the worker slots ({len(frames)} frames)")
+                np.ndarray(frame.shape, dtype=np.uint8, buffer=shm.buf, offset=i * self.slotBytes)[...] = frame
+                shapes.append(frame.shape)
+            try:
+                conn.send(shapes)
+                result = conn.recv()
+            except (EOFError, BrokenPipeError, ConnectionResetError):
+                self.retire(*self.workers[index], timeout=0)
+                self.workers[index] = None
+                raise RuntimeError(f"inference worker {index} died while running a batch")
+        finally:
+            self.idle.put(index)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def close(self):
+        workers = [worker for worker in self.workers if worker is not None]
+        for process, conn, shm in workers:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in workers:
+            self.retire(*worker)
+        self.workers = []
+
+inference_pool = None
+inference_pool_lock = threading.Lock()
+
+def inferencePool():
+    # Starts the worker processes on first use
+    global inference_pool
+    with inference_pool_lock:
+        if inference_pool is None:
+            pool = InferenceWorkerPool()
+            pool.start()
+            inference_pool = pool
+        return inference_pool
+
+def closeInferencePool():
+    global inference_pool
+    with inference_pool_lock:
+        if inference_pool is not None:
+            inference_pool.close()
+            inference_pool = None
+
+class ModelLoader:
+    # Loads and warms up the model off the event loop so the servers bind
+    # right away. Until it is ready, camera frames are turned away with the
+    # state and /ready answers 503.
+    IDLE, LOADING, WARMING, READY, FAILED = "idle", "loading", "warming", "ready", "failed"
+
+    def __init__(self):
+        self.state = self.IDLE
+        self.error = None
+        self.loadSeconds = None
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def ready(self):
+        return self.state == self.READY
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.loadInBackground, name="model-loader", daemon=True)
+            self.thread.start()
+
+    def loadInBackground(self):
+        try:
+            self.load()
+        except Exception as e:
+            print(f"Error[model_loader]: {e}")
+
+    def load(self):
+        # Blocks until the model is ready, raises if it cannot be loaded
+        global inference_backend
+        with self.lock:
+            if self.state == self.READY:
+                return
+            started = time.perf_counter()
+            self.state = self.LOADING
+            try:
+                if INFERENCE_WORKERS:
+                    inferencePool() # the workers warm up before they report in
+                else:
+                    backend = createInferenceBackend(input_size=MODEL_INFERENCE_SIZE)
+                    setModelClasses(backend.names)
+                    self.state = self.WARMING
+                    with model_lock:
+                        warmUpBackend(backend, MODEL_INFERENCE_SIZE)
+                    inference_backend = backend
+            except Exception as e:
+                self.state = self.FAILED
+                self.error = str(e)
+                raise
+            self.loadSeconds = time.perf_counter() - started
+            self.state = self.READY
+            print(f"Model ready in {self.loadSeconds:.1f} s")
+
+    def status(self):
+        status = {"state": self.state}
+        if self.error:
+            status["error"] = self.error
+        if self.loadSeconds is not None:
+            status["load_seconds"] = round(self.loadSeconds, 3)
+        return status
+
+model_loader = ModelLoader()
+
+def runInference(frames):
+    # One forward pass over a list of frames, returns one (N, 6) array per frame
+    if not model_loader.ready:
+        model_loader.load()
+    if INFERENCE_WORKERS:
+        pool = inferencePool()
+        with stage_seconds.time("inference", "batch"):
+            return pool.infer(frames)
+    with model_lock, stage_seconds.time("inference", "batch"):
+        return inference_backend.infer(frames)
+
+class InferenceScheduler:
+    # Collects the latest frame of each active camera and runs them through the
+    # model as a single batch, then hands every camera its own detections.
+    def __init__(self, batch_size=INFERENCE_BATCH_SIZE, batch_wait=INFERENCE_BATCH_WAIT, max_latency=MAX_FRAME_LATENCY,
+                 concurrency=max(1, INFERENCE_WORKERS)):
+        self.batchSize = batch_size
+        self.batchWait = batch_wait
+        self.maxLatency = max_latency
+        self.concurrency = concurrency
+        self.pending = [] # (frame, received_time, future)
+        self.wakeup = None
+        self.task = None
+        self.droppedFrames = 0
+        self.batches = 0
+
+    def start(self):
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+
+    async def infer(self, frame, received_time):
+        if self.task is None:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((frame, received_time, future))
+        self.wakeup.set()
+        return await future
+
+    async def collectBatch(self):
+        # Wait until the batch is full, every active camera has a frame queued or
+        # the wait budget is used up.
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batchWait
+        while len(self.pending) < self.batchSize and len(self.pending) < activeCameraCount():
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        batch = self.pending[:self.batchSize]
+        del self.pending[:self.batchSize]
+        return batch
+
+    async def run(self):
+        # One batch in flight per inference worker, a camera never has more
+        # than one frame queued so its frames still come back in order.
+        in_flight = asyncio.Semaphore(self.concurrency)
+        while True:
+            if not self.pending:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            await in_flight.acquire()
+            batch = await self.collectBatch()
+            current_time = time.time()
+            fresh = []
+            for frame, received_time, future in batch:
+                if future.done(): # the camera went away
+                    continue
+                if current_time - received_time > self.maxLatency:
+                    self.droppedFrames += 1
+                    future.set_result(None)
+                else:
+                    fresh.append((frame, future))
+            if not fresh:
+                in_flight.release()
+                continue
+            asyncio.create_task(self.runBatch(fresh, in_flight))
+
+    async def runBatch(self, fresh, in_flight):
+        try:
+            detections = await asyncio.to_thread(runInference, [frame for frame, _ in fresh])
+            self.batches += 1
+            for (_, future), frame_detections in zip(fresh, detections):
+                if not future.done():
+                    future.set_result(frame_detections)
+        except Exception as e:
+            print(f"Error[inference_scheduler]: {e}")
+            for _, future in fresh:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            in_flight.release()
+
+inference_scheduler = InferenceScheduler()
+
+FRAME_ARCHIVE = os.environ.get("FRAME_ARCHIVE", "0") == "1" # keep JPEGs of the processed frames for audits
+ARCHIVE_DIR = "image"         # one sub directory per camera
+ARCHIVE_INTERVAL = 2.0        # seconds between routine frames per camera, 0: event frames only
+ARCHIVE_EVENT_TYPES = ("UOD", "IN", "LOD", "Out")
+ARCHIVE_FRAMES_BEFORE = 5     # frames kept from before each pallet event
+ARCHIVE_FRAMES_AFTER = 5      # frames kept from after it
+ARCHIVE_MAX_MB = float(os.environ.get("ARCHIVE_MAX_MB", "500")) # per camera, the oldest files are deleted beyond this
+ARCHIVE_QUEUE_SIZE = 64       # frames waiting to be encoded, frames beyond this are dropped
+ARCHIVE_WORKERS = 2           # JPEG encoder threads
+ARCHIVE_JPEG_QUALITY = 90
+
+class CameraArchive:
+    # Files and pending event frames of one camera in FrameArchiver
+    def __init__(self, directory, frames_before):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.recent = collections.deque(maxlen=frames_before) # (frame, capture_time) not saved yet
+        self.framesAfter = 0
+        self.eventTag = None
+        self.routineTime = float("-inf")
+        self.saved = 0
+        self.dropped = 0
+        os.makedirs(directory, exist_ok=True)
+        names = sorted(name for name in os.listdir(directory) if name.endswith(".jpg")) # oldest first
+        self.files = collections.deque((os.path.join(directory, name), os.path.getsize(os.path.join(directory, name)))
+                                       for name in names)
+        self.bytes = sum(size for _, size in self.files)
+
+class FrameArchiver:
+    # Saves processed frames as JPEG without holding up the frame processor:
+    # frames are queued (dropped and counted when the queue is full) and
+    # encoded and written by ARCHIVE_WORKERS threads. Besides one routine
+    # frame every ARCHIVE_INTERVAL seconds, a pallet event saves the
+    # ARCHIVE_FRAMES_BEFORE frames before it and ARCHIVE_FRAMES_AFTER after
+    # it. Files are named by capture time, so nothing is overwritten across
+    # restarts, and every camera directory is capped at ARCHIVE_MAX_MB.
+    def __init__(self, directory=ARCHIVE_DIR, interval=ARCHIVE_INTERVAL, frames_before=ARCHIVE_FRAMES_BEFORE,
+                 frames_after=ARCHIVE_FRAMES_AFTER, max_mb=ARCHIVE_MAX_MB, queue_size=ARCHIVE_QUEUE_SIZE,
+                 workers=ARCHIVE_WORKERS, quality=ARCHIVE_JPEG_QUALITY):
+        self.directory = directory
+        self.interval = interval
+        self.framesBefore = frames_before
+        self.framesAfter = frames_after
+        self.maxBytes = int(max_mb * 1024 * 1024)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.workers = workers
+        self.quality = quality
+        self.cameras = {} # camera_id -> CameraArchive
+        self.lock = threading.Lock()
+        self.threads = []
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self.work, name=f"frame-archiver-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def camera(self, camera_id):
+        with self.lock:
+            archive = self.cameras.get(camera_id)
+            if archive is None:
+                directory = os.path.join(self.directory, re.sub(r"[^\w.-]", "_", camera_id))
+                archive = CameraArchive(directory, self.framesBefore)
+                self.cameras[camera_id] = archive
+            return archive
+
+    def offer(self, camera_id, frame, capture_time):
+        # Every processed frame comes through here, the frame must not change afterwards
+        archive = self.camera(camera_id)
+        with archive.lock:
+            if archive.framesAfter > 0:
+                archive.framesAfter -= 1
+                self.enqueue(archive, frame, capture_time, archive.eventTag)
+            elif self.interval and capture_time - archive.routineTime >= self.interval:
+                archive.routineTime = capture_time
+                self.enqueue(archive, frame, capture_time, "routine")
+            else:
+                archive.recent.append((frame, capture_time))
+
+    def trigger(self, camera_id, tag):
+        # A pallet event: save the frames before it and the next framesAfter
+        archive = self.camera(camera_id)
+        with archive.lock:
+            while archive.recent:
+                frame, capture_time = archive.recent.popleft()
+                self.enqueue(archive, frame, capture_time, tag)
+            archive.framesAfter = self.framesAfter
+            archive.eventTag = tag
+
+    def enqueue(self, archive, frame, capture_time, tag):
+        # called with archive.lock held
+        try:
+            self.queue.put_nowait((archive, frame, capture_time, tag))
+        except queue.Full:
+            archive.dropped += 1
+
+    def work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            try:
+                self.write(*item)
+            except Exception as e:
+                print(f"Error[frame_archiver]: {e}")
+
+    def write(self, archive, frame, capture_time, tag):
+        ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            raise ValueError("JPEG encoding failed")
+        stamp = datetime.fromtimestamp(capture_time).strftime("%Y%m%d-%H%M%S-%f")[:-3]
+        path = os.path.join(archive.directory, f"{stamp}_{tag}.jpg")
+        jpeg.tofile(path)
+        with archive.lock:
+            archive.files.append((path, jpeg.nbytes))
+            archive.bytes += jpeg.nbytes
+            archive.saved += 1
+            expired = []
+            while archive.bytes > self.maxBytes and len(archive.files) > 1:
+                old_path, size = archive.files.popleft()
+                archive.bytes -= size
+                expired.append(old_path)
+        for old_path in expired:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+    def close(self):
+        # Waits for the queued frames to be written
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+frame_archiver = FrameArchiver()
+
+# async def video_stream(websocket):
+#     try:         
+#         processing_flag = 0
+#         print("Client connected.")      
+#         async for message in websocket:
+#             if processing_flag == 1:
+#                 print("Warning: Processing...")
+#                 continue
+#             nparr = np.frombuffer(message, np.uint8)
+#             # Decode the image
+#             frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR) # Decodes as BGR           
+
+#             if frame is None:
+#                 print("Warning: Received an empty or corrupt frame.")
+#                 continue      
+#             print(f"===1== {frame.shape} === {datetime.now().strftime('%H:%M:%S.%f')[:-3]}")
+#             #saveFrame(frame)    
+#             frame = cv2.resize(frame, (640, 640))
+#             # detectObject(frame)   
+#             # drawStagingArea(frame)
+#             # showFrame(frame)  
+#             processing_flag = 1
+#             await frame_processor(frame)
+#             processing_flag = 0
+#             print(f"===2== {frame.shape} === {datetime.now().strftime('%H:%M:%S.%f')[:-3]}")
+#             if cv2.waitKey(1) & 0xFF == ord('q'):
+#                 break          
+#     except websockets.exceptions.ConnectionClosed:
+#         print("Client disconnected.")
+#     finally:
+#         cv2.destroyAllWindows()
+#         resetObjects()
+#         print("Websocket signal is 'no', objects reset!")
+#         await asyncio.sleep(1)  # Non-blocking sleep
+
+# async def main():
+#     start_server = websockets.serve(video_stream, "localhost", 5001)
+#     async with start_server:
+#         print("WebSocket server started on ws://localhost:5001")
+#         await asyncio.Future()
+camera_sessions = {} # camera id -> CameraSession
+
+def activeCameraCount():
+    return max(1, sum(1 for session in camera_sessions.values() if session.connections > 0))
+
+FRAME_SIZE = 640
+REDUCED_DECODE_FLAGS = ((4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+DECODE_REDUCTION = {cv2.IMREAD_COLOR: 1, cv2.IMREAD_REDUCED_COLOR_2: 2, cv2.IMREAD_REDUCED_COLOR_4: 4}
+
+def reducedDecodeFlags(source_size):
+    # Largest JPEG DCT scaling that still leaves at least FRAME_SIZE pixels per side
+    width, height = source_size
+    for factor, flags in REDUCED_DECODE_FLAGS:
+        if width >= FRAME_SIZE * factor and height >= FRAME_SIZE * factor:
+            return flags
+    return cv2.IMREAD_COLOR
+
+def decodeFrame(message, flags=cv2.IMREAD_COLOR):
+    # JPEG/PNG bytes -> (FRAME_SIZE x FRAME_SIZE BGR frame, source (width, height)),
+    # (None, None) if the data is corrupt
+    frame = cv2.imdecode(np.frombuffer(message, np.uint8), flags)
+    if frame is None:
+        return None, None
+    reduction = DECODE_REDUCTION.get(flags, 1)
+    source_size = (frame.shape[1] * reduction, frame.shape[0] * reduction)
+    return cv2.resize(frame, (FRAME_SIZE, FRAME_SIZE)), source_size
+
+def cameraIdFromPath(path):
+    # ws://host:5000/Camera02 -> "Camera02", ws://host:5000/ -> DEFAULT_CAMERA_ID
+    camera_id = (path or "").split("?")[0].strip("/")
+    return camera_id or DEFAULT_CAMERA_ID
+
+def getCameraSession(camera_id):
+    session = camera_sessions.get(camera_id)
+    if session is None:
+        session = CameraSession(camera_id, snapshots=tracker_snapshots, archiver=frame_archiver if FRAME_ARCHIVE else None)
+        session.processorTask = asyncio.create_task(session.frameProcessor())
+        camera_sessions[camera_id] = session
+    return session
+
+# Framed ingest protocol. A binary message that starts with FRAME_MAGIC
+# carries a header, anything else is a bare JPEG/PNG frame as before:
+#   magic "DKF", version, header length, sequence number, capture time
+#   (seconds on the sender's monotonic clock), encoding, width, height,
+#   camera id length, then the UTF-8 camera id; the encoded frame starts at
+#   the header length, so later versions can append fields.
+# Framed senders get {"type": "rate", "max_fps": ...} text messages back
+# whenever the frame rate the server gets through for the camera changes.
+FRAME_MAGIC = b"DKF"
+FRAME_PROTOCOL_VERSION = 1
+FRAME_HEADER = struct.Struct("!3sBHIdBHHB")
+FRAME_ENCODINGS = {0: "jpeg", 1: "png"}
+FRAME_REORDER_WINDOW = 64     # an older sequence number within this is a late frame, further back a restarted sender
+RATE_CONTROL_INTERVAL = 2.0   # seconds between rate checks per framed connection
+RATE_MIN_FPS = 1.0
+RATE_MAX_FPS = 30.0
+RATE_HEADROOM = 1.2           # ask for this much more than the server gets through
+RATE_RESEND_CHANGE = 0.1      # relative change of the rate that is sent to the sender again
+
+FrameHeader = collections.namedtuple("FrameHeader", "version sequence captureTime encoding width height cameraId payloadOffset")
+
+def packFrame(payload, camera_id, sequence, capture_time=None, encoding="jpeg", width=0, height=0):
+    # Sender side of the framed protocol, e.g. for camera clients and tests
+    encoding_id = {name: value for value, name in FRAME_ENCODINGS.items()}[encoding]
+    camera = camera_id.encode("utf-8")
+    header_length = FRAME_HEADER.size + len(camera)
+    capture_time = time.monotonic() if capture_time is None else capture_time
+    return (FRAME_HEADER.pack(FRAME_MAGIC, FRAME_PROTOCOL_VERSION, header_length, sequence % 2**32, capture_time,
+                              encoding_id, width, height, len(camera)) + camera + bytes(payload))
+
+def parseFrameHeader(message):
+    # FrameHeader of a framed message, None for a bare JPEG/PNG frame; raises
+    # ValueError for a header this server cannot read
+    if not isinstance(message, bytes) or message[:len(FRAME_MAGIC)] != FRAME_MAGIC:
+        return None
+    if len(message) < FRAME_HEADER.size:
+        raise ValueError("truncated frame header")
+    _, version, header_length, sequence, capture_time, encoding, width, height, id_length = FRAME_HEADER.unpack_from(message)
+    if version != FRAME_PROTOCOL_VERSION:
+        raise ValueError(f"unsupported frame protocol version {version}, this server speaks {FRAME_PROTOCOL_VERSION}")
+    if not FRAME_HEADER.size + id_length <= header_length <= len(message):
+        raise ValueError(f"bad header length {header_length}")
+    if encoding not in FRAME_ENCODINGS:
+        raise ValueError(f"unsupported encoding {encoding}")
+    camera_id = message[FRAME_HEADER.size:FRAME_HEADER.size + id_length].decode("utf-8", errors="replace")
+    return FrameHeader(version, sequence, capture_time, FRAME_ENCODINGS[encoding], width, height, camera_id, header_length)
+
+class IngestConnection:
+    # One websocket connection: which camera session it feeds, the sequence
+    # numbers and clock of a framed sender and its rate control.
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.pathCameraId = cameraIdFromPath(websocket.request.path)
+        self.session = None
+        self.framed = False
+        self.lastSequence = None
+        self.clockOffset = None # server time - sender time, the smallest seen
+        self.rateTime = time.monotonic()
+        self.sentFps = None
+        self.reportedState = None
+
+    def attach(self, camera_id):
+        # The camera id of the first message decides the session, a framed
+        # header overrides the websocket path
+        if self.session is not None:
+            if self.session.cameraId == camera_id:
+                return self.session
+            self.detach()
+        session = getCameraSession(camera_id)
+        print(f"Client connected: {camera_id}")
+        session.resumeObjects()
+        session.connections += 1
+        self.session = session
+        self.lastSequence = None
+        self.clockOffset = None
+        return session
+
+    def detach(self):
+        session, self.session = self.session, None
+        session.connections -= 1
+        if session.connections == 0 and session.snapshotDirty:
+            session.saveSnapshot() # the state at the blip, for the reconnect
+        print(f"{session.cameraId}: received {session.framesReceived}, decoded {session.framesDecoded}, dropped {session.framesDropped}, stale {session.framesStale}, static {session.framesGated}, rejected {session.framesRejected}, lost {session.framesLost} frames")
+
+    def acceptSequence(self, sequence):
+        # False for a duplicate or late frame, counts the frames lost in between
+        if self.lastSequence is not None and sequence == 0: # the sender restarted, its clock may have too
+            self.clockOffset = None
+        elif self.lastSequence is not None:
+            step = (sequence - self.lastSequence) % 2**32
+            if step == 0 or step > 2**32 - FRAME_REORDER_WINDOW:
+                self.session.framesOutOfOrder += 1
+                return False
+            if step < 2**31:
+                self.session.framesLost += step - 1
+            else: # far back, a restarted sender
+                self.clockOffset = None
+        self.lastSequence = sequence
+        return True
+
+    def captureTime(self, header, received_time):
+        # Sender monotonic time -> server time. The smallest offset seen is
+        # the one with the least network delay, later frames that took longer
+        # keep their true capture time and age accordingly.
+        offset = received_time - header.captureTime
+        if self.clockOffset is None or offset < self.clockOffset:
+            self.clockOffset = offset
+        return header.captureTime + self.clockOffset
+
+    async def sendStatus(self, status, **fields):
+        await self.websocket.send(json.dumps({"status": status, **fields}))
+
+    async def controlRate(self, now=None):
+        # Ask a framed sender for about the frame rate the server gets through:
+        # what it processes when frames are being overwritten, more otherwise.
+        # The headroom lets a throttled sender ramp back up, a stall (a pause,
+        # a worker restart) is no measurement and leaves the rate alone.
+        now = time.monotonic() if now is None else now
+        if not self.framed or now - self.rateTime < RATE_CONTROL_INTERVAL:
+            return
+        self.rateTime = now
+        received_meter, processed_meter = self.session.receivedRate, self.session.processedRate
+        if received_meter.isIdle(now) or processed_meter.isIdle(now):
+            return
+        received, processed = received_meter.rate(now), processed_meter.rate(now)
+        fps = processed if processed < 0.9 * received else received
+        fps = min(RATE_MAX_FPS, max(RATE_MIN_FPS, fps * RATE_HEADROOM))
+        if self.sentFps is None or abs(fps - self.sentFps) >= RATE_RESEND_CHANGE * self.sentFps:
+            self.sentFps = fps
+            await self.websocket.send(json.dumps({"type": "rate", "max_fps": round(fps, 1),
+                                                  "received_fps": round(received, 1), "processed_fps": round(processed, 1)}))
+
+async def video_stream(websocket):
+    connection = IngestConnection(websocket)
+    try:
+        async for message in websocket:
+            received_time = time.time()
+            try:
+                header = parseFrameHeader(message)
+            except ValueError as e:
+                await connection.sendStatus("error", error=str(e))
+                continue
+            session = connection.attach(header.cameraId if header is not None and header.cameraId else connection.pathCameraId)
+            if not model_loader.ready:
+                # tell the client once per state why its frames are dropped
+                session.framesRejected += 1
+                if connection.reportedState != model_loader.state:
+                    connection.reportedState = model_loader.state
+                    await connection.sendStatus("rejected", **model_loader.status())
+                continue
+            if connection.reportedState is not None:
+                connection.reportedState = None
+                await connection.sendStatus("accepted", **model_loader.status())
+            capture_time = received_time
+            if header is not None:
+                connection.framed = True
+                if not connection.acceptSequence(header.sequence):
+                    continue
+                capture_time = connection.captureTime(header, received_time)
+                if header.encoding == "jpeg" and header.width and session.framesDecoded == 0:
+                    session.decodeFlags = reducedDecodeFlags((header.width, header.height)) # from the first frame on
+                message = memoryview(message)[header.payloadOffset:]
+            session.queueFrame(message, capture_time)
+            await connection.controlRate()
+
+    except websockets.exceptions.ConnectionClosed:
+        print(f"Client disconnected: {connection.pathCameraId}")
+    finally:
+        if connection.session is not None:
+            connection.detach()
+        print("Websocket signal is 'no', objects reset!")
+        await asyncio.sleep(1)
+
+async def displayWindows():
+    # Local cv2 windows, refreshed at the preview rate on the loop thread instead
+    # of once per received message. 'q' closes them, the server keeps running.
+    shown = {}
+    while True:
+        for camera_id, session in list(camera_sessions.items()):
+            frame = session.displayFrame
+            if frame is not None and shown.get(camera_id) is not frame:
+                try:
+                    showFrame(frame, camera_id)
+                except cv2.error as e:
+                    print(f"Error[display]: cannot open a window ({e}), run with --headless")
+                    return
+                shown[camera_id] = frame
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            cv2.destroyAllWindows()
+            return
+        await asyncio.sleep(1 / PREVIEW_FPS)
+
+class PreviewServer:
+    # HTTP preview of the annotated frames:
+    #   GET /preview/<camera_id>        multipart MJPEG stream
+    #   GET /snapshot/<camera_id>.jpg   single JPEG
+    # Frames are JPEG encoded in a worker thread, at most PREVIEW_FPS per camera
+    # and only while a viewer is connected; the encoded frame is shared between viewers.
+    def __init__(self, fps=PREVIEW_FPS, quality=PREVIEW_JPEG_QUALITY):
+        self.interval = 1.0 / fps
+        self.quality = quality
+        self.encoded = {} # camera_id -> (frame, jpeg bytes)
+
+    def routes(self):
+        return [web.get("/preview/{camera_id}", self.stream),
+                web.get("/snapshot/{camera_id}.jpg", self.snapshot)]
+
+    async def encode(self, camera_id, session):
+        frame = session.displayFrame
+        if frame is None:
+            return None
+        cached = self.encoded.get(camera_id)
+        if cached is not None and cached[0] is frame:
+            return cached[1]
+        ok, jpeg = await asyncio.to_thread(cv2.imencode, ".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return None
+        self.encoded[camera_id] = (frame, jpeg.tobytes())
+        return self.encoded[camera_id][1]
+
+    def watch(self, camera_id):
+        session = camera_sessions.get(camera_id)
+        if session is None:
+            raise web.HTTPNotFound(text=f"unknown camera {camera_id}")
+        session.viewers += 1
+        return session
+
+    def unwatch(self, camera_id, session):
+        session.viewers -= 1
+        if session.viewers == 0:
+            self.encoded.pop(camera_id, None)
+            if HEADLESS:
+                session.displayFrame = None # stale once nobody is watching
+
+    async def snapshot(self, request):
+        camera_id = request.match_info["camera_id"]
+        session = self.watch(camera_id)
+        try:
+            # the frame being processed now is the first one annotated for us
+            for _ in range(int(2 / self.interval)):
+                jpeg = await self.encode(camera_id, session)
+                if jpeg is not None:
+                    return web.Response(body=jpeg, content_type="image/jpeg")
+                await asyncio.sleep(self.interval)
+            raise web.HTTPServiceUnavailable(text=f"no frame from {camera_id}")
+        finally:
+            self.unwatch(camera_id, session)
+
+    async def stream(self, request):
+        camera_id = request.match_info["camera_id"]
+        session = self.watch(camera_id)
+        response = web.StreamResponse(headers={"Content-Type": "multipart/x-mixed-replace; boundary=frame",
+                                               "Cache-Control": "no-cache"})
+        try:
+            await response.prepare(request)
+            last = None
+            while True:
+                jpeg = await self.encode(camera_id, session)
+                if jpeg is not None and jpeg is not last:
+                    await response.write(b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: "
+                                         + str(len(jpeg)).encode() + b"\r\n\r\n" + jpeg + b"\r\n")
+                    last = jpeg
+                await asyncio.sleep(self.interval)
+        except ConnectionResetError: # viewer went away
+            pass
+        finally:
+            self.unwatch(camera_id, session)
+        return response
+
+preview_server = PreviewServer()
+
+def metricLines(name, metric_type, help_text, samples):
+    # samples: [(labels dict, value)]
+    name = f"{METRICS_PREFIX}_{name}"
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        label_text = ",".join(f'{key}="{label}"' for key, label in labels.items())
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return lines
+
+def renderMetrics():
+    sessions = sorted(camera_sessions.items())
+    lines = stage_seconds.render()
+    lines += metricLines("model_ready", "gauge", "1 once the model is loaded and warmed up",
+                         [({"state": model_loader.state}, int(model_loader.ready))])
+    lines += metricLines("frame_slot_depth", "gauge", "Compressed frames waiting for the frame processor",
+                         [({"camera": camera_id}, int(session.frameSlot.value is not None)) for camera_id, session in sessions])
+    lines += metricLines("inference_queue_depth", "gauge", "Decoded frames waiting for the inference scheduler",
+                         [({}, len(inference_scheduler.pending))])
+    lines += metricLines("frames_received_total", "counter", "Frames received over the websocket",
+                         [({"camera": camera_id}, session.framesReceived) for camera_id, session in sessions])
+    lines += metricLines("frames_decoded_total", "counter", "Frames decoded for inference",
+                         [({"camera": camera_id}, session.framesDecoded) for camera_id, session in sessions])
+    lines += metricLines("frames_dropped_total", "counter", "Frames skipped before inference",
+                         [({"camera": camera_id, "reason": reason}, count) for camera_id, session in sessions
+                          for reason, count in (("overwritten", session.framesDropped), ("stale", session.framesStale),
+                                                ("model_not_ready", session.framesRejected),
+                                                ("out_of_order", session.framesOutOfOrder))]
+                         + [({"camera": "batch", "reason": "latency"}, inference_scheduler.droppedFrames)])
+    lines += metricLines("frames_lost_total", "counter", "Frames missing from the sequence numbers of framed senders",
+                         [({"camera": camera_id}, session.framesLost) for camera_id, session in sessions])
+    lines += metricLines("frames_static_total", "counter", "Frames that reused the previous detections because nothing moved",
+                         [({"camera": camera_id}, session.framesGated) for camera_id, session in sessions])
+    lines += metricLines("frames_propagated_total", "counter", "Frames between keyframes, tracks predicted without running the model",
+                         [({"camera": camera_id}, session.framesPropagated) for camera_id, session in sessions])
+    lines += metricLines("fps", "gauge", "Effective frames per second per connection",
+                         [({"camera": camera_id, "stage": stage}, f"{meter.rate():.2f}") for camera_id, session in sessions
+                          for stage, meter in (("received", session.receivedRate), ("processed", session.processedRate))])
+    lines += metricLines("connections", "gauge", "Open websocket connections",
+                         [({"camera": camera_id}, session.connections) for camera_id, session in sessions])
+    lines += metricLines("tracks", "gauge", "Active pallet tracks per zone state",
+                         [({"camera": camera_id, "state": state}, count) for camera_id, session in sessions
+                          for state, count in session.palletTracker.counts().items()])
+    lines += metricLines("doors", "gauge", "Tracked doors",
+                         [({"camera": camera_id}, len(session.objectDoors)) for camera_id, session in sessions])
+    archives = sorted(frame_archiver.cameras.items())
+    lines += metricLines("archive_frames_total", "counter", "Frames saved by the frame archiver or dropped because its queue was full",
+                         [({"camera": camera_id, "result": result}, count) for camera_id, archive in archives
+                          for result, count in (("saved", archive.saved), ("dropped", archive.dropped))])
+    lines += metricLines("archive_bytes", "gauge", "Bytes of archived frames on disk",
+                         [({"camera": camera_id}, archive.bytes) for camera_id, archive in archives])
+    outbox = event_dispatcher.outbox
+    lines += metricLines("events_pending", "gauge", "Events in the outbox waiting for delivery",
+                         [({}, outbox.pendingCount() if outbox is not None else 0)])
+    lines += metricLines("events_total", "counter", "Events by delivery result",
+                         [({"result": "delivered"}, event_dispatcher.sent), ({"result": "rejected"}, event_dispatcher.rejected)])
+    return "\n".join(lines) + "\n"
+
+async def metricsHandler(request):
+    return web.Response(body=renderMetrics().encode(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+async def readyHandler(request):
+    # Readiness probe: 200 once the model is warmed up, 503 while loading or after a failed load
+    return web.json_response(model_loader.status(), status=200 if model_loader.ready else 503)
+
+async def traceHandler(request):
+    # POST /trace?frames=N traces the next N processed frames
+    try:
+        frames = int(request.query.get("frames", TRACE_FRAMES))
+    except ValueError:
+        raise web.HTTPBadRequest(text="frames must be an integer")
+    if frames <= 0:
+        raise web.HTTPBadRequest(text="frames must be positive")
+    return web.json_response({"frames": frames, "path": frame_tracer.start(frames)})
+
+async def main():
+    model_loader.start() # load and warm up while the servers bind
+    await event_dispatcher.start()
+    if TRACKER_SNAPSHOT_INTERVAL > 0:
+        tracker_snapshots.open()
+    if FRAME_ARCHIVE:
+        frame_archiver.start()
+    try:
+        # kill -USR1 <pid> traces the next TRACE_FRAMES frames
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, frame_tracer.start)
+    except (AttributeError, NotImplementedError): # no SIGUSR1 / signal handlers on Windows
+        pass
+    http_runner = None
+    if HTTP_PORT:
+        app = web.Application()
+        app.add_routes(preview_server.routes())
+        app.add_routes([web.get("/metrics", metricsHandler), web.get("/ready", readyHandler),
+                        web.post("/trace", traceHandler)])
+        http_runner = web.AppRunner(app)
+        await http_runner.setup()
+        await web.TCPSite(http_runner, "0.0.0.0", HTTP_PORT).start()
+        print(f"HTTP server started on http://0.0.0.0:{HTTP_PORT} (/preview/<camera_id>, /metrics, /ready, POST /trace)")
+    display_task = None if HEADLESS else asyncio.create_task(displayWindows())
+    start_server = websockets.serve(video_stream, "0.0.0.0", 5000)
+    try:
+        async with start_server:
+            print("WebSocket server started on ws://0.0.0.0:5000")
+            await asyncio.Future()  # Run forever
+    finally:
+        if display_task is not None:
+            display_task.cancel()
+        if http_runner is not None:
+            await http_runner.cleanup()
+        await event_dispatcher.close()
+        tracker_snapshots.close()
+        await asyncio.to_thread(frame_archiver.close)
+        closeInferencePool()
+class ReplayClock:
+    # Tracker clock that advances by one frame interval per replayed frame, so
+    # the 1 s / 3 s timeouts behave the same however fast the replay runs.
+    def __init__(self, fps, start=0.0):
+        self.interval = 1.0 / fps
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self):
+        self.now += self.interval
+
+def naturalSortKey(path):
+    # frame_2.jpg before frame_10.jpg
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", path)]
+
+def replayFrames(path):
+    # Yields (encoded bytes or None, decoded frame or None) for every frame of a
+    # directory of images or a video file, plus the source fps if known.
+    if os.path.isdir(path):
+        files = sorted((os.path.join(path, name) for name in os.listdir(path)
+                        if name.lower().endswith((".jpg", ".jpeg", ".png"))), key=naturalSortKey)
+        def frames():
+            for file_name in files:
+                with open(file_name, "rb") as f:
+                    yield f.read(), None
+        return frames(), None
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise SystemExit(f"Cannot open {path}")
+    def frames():
+        try:
+            while True:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                yield None, frame
+        finally:
+            capture.release()
+    return frames(), capture.get(cv2.CAP_PROP_FPS) or None
+
+def printStageLatency(name, samples):
+    if not samples:
+        return
+    samples = np.array(samples) * 1000
+    print(f"  {name:<10} mean {samples.mean():7.2f} ms  p50 {np.percentile(samples, 50):7.2f} ms  "
+          f"p95 {np.percentile(samples, 95):7.2f} ms  max {samples.max():7.2f} ms")
+
+def replay(path, camera_id=DEFAULT_CAMERA_ID, fps=None, events_out=None):
+    # Runs recorded frames through decode, inference and tracking as fast as
+    # possible and reports throughput, per-stage latency and the events.
+    frames, source_fps = replayFrames(path)
+    clock = ReplayClock(fps or source_fps or 5)
+    model_loader.load() # keep the load and warm-up out of the inference latency
+    events = []
+    def recordEvent(doc_cat, doc_type, pallet_id, door_id, comments, camera_no=camera_id):
+        events.append({"time": round(clock(), 3), "DocCat": doc_cat, "DocType": doc_type,
+                       "PAK_ID": str(pallet_id) if pallet_id is not None else None, "DoorNO": door_id})
+        print(f"  [{clock():9.3f}s] {doc_cat} {doc_type} {pallet_id or ''} {door_id or ''}")
+    session = CameraSession(camera_id, clock=clock, send_event=recordEvent)
+    stages = {"decode": [], "motion": [], "inference": [], "tracking": []}
+    frame_count = 0
+    started = time.perf_counter()
+    for message, frame in frames:
+        if not session.isKeyframe(clock()):
+            # as processPropagatedFrame: no decode, no model run, no tracker update
+            session.framesSinceKeyframe += 1
+            session.framesPropagated += 1
+            frame_count += 1
+            clock.advance()
+            continue
+        t0 = time.perf_counter()
+        if message is not None:
+            frame, _ = decodeFrame(message)
+        elif frame is not None:
+            frame = cv2.resize(frame, (FRAME_SIZE, FRAME_SIZE))
+        if frame is None:
+            print("Warning: skipped an empty or corrupt frame.")
+            clock.advance()
+            continue
+        t1 = time.perf_counter()
+        # same motion gate as processKeyframe: static frames reuse the detections
+        detections, small = None, None
+        if session.motionGate is not None:
+            detections, small = session.checkMotion(frame, clock())
+            stages["motion"].append(time.perf_counter() - t1)
+        t2 = time.perf_counter()
+        if detections is not None:
+            session.framesGated += 1
+        else:
+            image, offset = session.inferenceInput(frame, clock())
+            detections = session.toFrameSpace(runInference([image])[0], offset)
+            if small is not None:
+                session.motionGate.update(small, detections, clock())
+            stages["inference"].append(time.perf_counter() - t2)
+        t3 = time.perf_counter()
+        session.processDetections(frame, detections, draw=False)
+        session.keyframeDone(detections, clock())
+        stages["decode"].append(t1 - t0)
+        stages["tracking"].append(time.perf_counter() - t3)
+        frame_count += 1
+        clock.advance()
+    elapsed = time.perf_counter() - started
+    print(f"Replayed {frame_count} frames in {elapsed:.2f} s: {frame_count / elapsed if elapsed else 0:.1f} fps, {len(events)} events, "
+          f"{session.framesGated} static, {session.framesPropagated} propagated")
+    for name, samples in stages.items():
+        printStageLatency(name, samples)
+    if events_out:
+        with open(events_out, "w") as f:
+            json.dump(events, f, indent=2)
+    return events
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dock camera pallet/door tracker")
+    parser.add_argument("--replay", metavar="PATH", help="replay a directory of frames or a video file offline instead of serving websockets")
+    parser.add_argument("--camera", default=DEFAULT_CAMERA_ID, help="camera id used for the zone config and events in replay")
+    parser.add_argument("--fps", type=float, help="frame rate of the replay clock, default: the video fps or 5")
+    parser.add_argument("--events-out", metavar="FILE", help="write the replayed event sequence to a JSON file")
+    parser.add_argument("--headless", action="store_true", help="no cv2 windows, watch the cameras through the preview server instead")
+    parser.add_argument("--http-port", type=int, default=HTTP_PORT, help="HTTP port of the preview and /metrics, 0 disables it")
+    args = parser.parse_args()
+    HEADLESS = HEADLESS or args.headless
+    HTTP_PORT = args.http_port
+    if args.replay:
+        try:
+            replay(args.replay, args.camera, args.fps, args.events_out)
+        finally:
+            closeInferencePool()
+    else:
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            print("Server stopped by user.")
@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("torch")
+from aiohttp import web
+from aiohttp.test_utils import unused_port
+
+import app_ai
+
+
+async def deliverAgainstStub(tmp_path, count, failures):
+    # Local API that answers 503 to the first `failures` posts of event 0
+    received, accepted = [], []
+    async def post(request):
+        payload = await request.json()
+        received.append(payload["n"])
+        if payload["n"] == 0 and received.count(0) <= failures:
+            return web.Response(status=503, text="busy")
+        accepted.append(payload["n"])
+        return web.json_response({"ok": True})
+    app = web.Application()
+    app.router.add_post("/api/{doc_cat}", post)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    port = unused_port()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    dispatcher = app_ai.EventDispatcher(api_url=f"http://127.0.0.1:{port}/api/", bulk_endpoint=None,
+                                        outbox_path=str(tmp_path / "outbox.db"))
+    try:
+        await dispatcher.start()
+        for n in range(count):
+            dispatcher.submit("Stage", {"n": n}, f"event {n}")
+        for _ in range(200):
+            if len(accepted) == count:
+                break
+            await asyncio.sleep(0.05)
+    finally:
+        await dispatcher.close()
+        await runner.cleanup()
+    return received, accepted
+
+
+def test_events_are_delivered_in_order_across_retries(tmp_path):
+    received, accepted = asyncio.run(deliverAgainstStub(tmp_path, 6, failures=1))
+    assert accepted == [0, 1, 2, 3, 4, 5]
+    assert received == [0, 0, 1, 2, 3, 4, 5] # nothing behind the failed event was sent before its retry
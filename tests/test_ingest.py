@@ -0,0 +1,118 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("torch")
+
+import app_ai
+
+
+class FakeWebsocket:
+    def __init__(self, path="/Camera01"):
+        self.request = SimpleNamespace(path=path)
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(json.loads(message))
+
+
+def connection():
+    ingest = app_ai.IngestConnection(FakeWebsocket())
+    ingest.session = app_ai.CameraSession("Camera01")
+    ingest.framed = True
+    ingest.rateTime = 0.0
+    return ingest
+
+
+def run(ingest, sender_fps, capacity, start, seconds):
+    # Frames at sender_fps, the server processes at most capacity of them,
+    # rate checks every RATE_CONTROL_INTERVAL; returns the time reached
+    now = start
+    while now < start + seconds:
+        ingest.session.receivedRate.tick(now)
+        if sender_fps <= capacity or int(now * capacity) != int((now - 1 / sender_fps) * capacity):
+            ingest.session.processedRate.tick(now)
+        if now - ingest.rateTime >= app_ai.RATE_CONTROL_INTERVAL:
+            asyncio.run(ingest.controlRate(now))
+        now += 1 / sender_fps
+    return now
+
+
+def follow(ingest, capacity, sender_fps, start, checks):
+    # A sender that always sends at the last max_fps it was given
+    now = start
+    for _ in range(checks):
+        now = run(ingest, sender_fps, capacity, now, app_ai.RATE_CONTROL_INTERVAL)
+        if ingest.websocket.sent:
+            sender_fps = ingest.websocket.sent[-1]["max_fps"]
+    return sender_fps, now
+
+
+def test_rate_ramps_up_from_a_low_rate():
+    ingest = connection()
+    fps, _ = follow(ingest, capacity=25, sender_fps=1.0, start=1000.0, checks=150)
+    assert fps >= 25
+
+
+def test_stall_does_not_throttle_the_sender():
+    ingest = connection()
+    fps, now = follow(ingest, capacity=25, sender_fps=30.0, start=1000.0, checks=10)
+    assert fps >= 25
+    sent = len(ingest.websocket.sent)
+    now += 2.5 # e.g. a paused sender, then its first frame is not processed yet
+    ingest.session.receivedRate.tick(now)
+    asyncio.run(ingest.controlRate(now))
+    assert len(ingest.websocket.sent) == sent
+    run(ingest, fps, 25, now + 1 / fps, 3 * app_ai.RATE_CONTROL_INTERVAL)
+    assert all(message["max_fps"] >= 25 for message in ingest.websocket.sent[sent:])
+
+
+def test_accept_sequence():
+    ingest = connection()
+    session = ingest.session
+    assert ingest.acceptSequence(10)
+    assert not ingest.acceptSequence(10) # duplicate
+    assert ingest.acceptSequence(11)
+    assert not ingest.acceptSequence(8) # late
+    assert session.framesOutOfOrder == 2
+    assert ingest.acceptSequence(15) # 12, 13, 14 lost
+    assert session.framesLost == 3
+    ingest.clockOffset = 5.0
+    assert ingest.acceptSequence(0) # restarted sender
+    assert ingest.clockOffset is None
+    ingest.clockOffset = 5.0
+    assert ingest.acceptSequence(1000)
+    assert ingest.acceptSequence(3) # far back, restarted without starting at 0
+    assert ingest.clockOffset is None
+    assert session.framesLost == 3 + 999 # 1 .. 999
+
+
+def test_accept_sequence_wraps_around():
+    ingest = connection()
+    assert ingest.acceptSequence(2**32 - 1)
+    assert ingest.acceptSequence(1) # 0 lost
+    assert ingest.session.framesLost == 1
+
+
+def test_parse_frame_header():
+    message = app_ai.packFrame(b"\xff\xd8jpeg", "Camera02", 7, capture_time=12.5, width=1920, height=1080)
+    header = app_ai.parseFrameHeader(message)
+    assert (header.sequence, header.captureTime, header.encoding, header.width, header.height, header.cameraId) == \
+        (7, 12.5, "jpeg", 1920, 1080, "Camera02")
+    assert message[header.payloadOffset:] == b"\xff\xd8jpeg"
+    assert app_ai.parseFrameHeader(b"\xff\xd8bare jpeg") is None
+    assert app_ai.parseFrameHeader("text") is None
+
+
+@pytest.mark.parametrize("message, error", [
+    (app_ai.FRAME_MAGIC + b"\x01", "truncated"),
+    (app_ai.FRAME_HEADER.pack(app_ai.FRAME_MAGIC, 2, app_ai.FRAME_HEADER.size, 0, 0.0, 0, 0, 0, 0), "version"),
+    (app_ai.FRAME_HEADER.pack(app_ai.FRAME_MAGIC, 1, app_ai.FRAME_HEADER.size, 0, 0.0, 9, 0, 0, 0), "encoding"),
+    (app_ai.FRAME_HEADER.pack(app_ai.FRAME_MAGIC, 1, app_ai.FRAME_HEADER.size + 50, 0, 0.0, 0, 0, 0, 0), "header length"),
+    (app_ai.FRAME_HEADER.pack(app_ai.FRAME_MAGIC, 1, app_ai.FRAME_HEADER.size, 0, 0.0, 0, 0, 0, 4) + b"Cam1", "header length"),
+])
+def test_parse_frame_header_rejects(message, error):
+    with pytest.raises(ValueError, match=error):
+        app_ai.parseFrameHeader(message)
@@ -0,0 +1,142 @@
+# Event regression tests: detection arrays go through CameraSession.processDetections
+# on a fake clock, the way the live path hands them over after inference.
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+import app_ai
+
+FRAME_INTERVAL = 0.2
+DOOR = [160, 40, 300, 90, 0.9, 1] # open door above the door side line of STAGING_AREA_BOUNDS
+RACK_SIDE = (620, 300)
+STAGING = (450, 350)
+
+class FakeClock:
+    def __init__(self, start=1000.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+def pallet(center, conf=0.85, width=40, height=30):
+    x0, y0 = center
+    return [x0 - width // 2, y0 - height // 2, x0 + width // 2, y0 + height // 2, conf, 0]
+
+def walk(start, end, steps):
+    return [(int(start[0] + (end[0] - start[0]) * k / steps), int(start[1] + (end[1] - start[1]) * k / steps))
+            for k in range(1, steps + 1)]
+
+def visit(outside, inside, settle=15, steps=8):
+    # outside -> staging area, rest there, back to the same side
+    return [outside] * 3 + walk(outside, inside, steps) + [inside] * settle + walk(inside, outside, steps) + [outside] * 3
+
+def offset(path, dx, dy):
+    return [(x + dx, y + dy) for x, y in path]
+
+def runFrames(paths, conf=0.85, tail=20):
+    # One pallet per path, one position per frame (None: not in that frame); returns (DocCat, DocType, pallet id) with
+    # the uuids replaced by P0, P1, ... in order of appearance
+    app_ai.setModelClasses({0: "pallet", 1: "door", 2: "forklift"})
+    clock = FakeClock()
+    events = []
+    session = app_ai.CameraSession("Camera01", clock=clock,
+                                   send_event=lambda doc_cat, doc_type, pallet_id, *rest: events.append((doc_cat, doc_type, pallet_id)))
+    frame = np.zeros((app_ai.FRAME_SIZE, app_ai.FRAME_SIZE, 3), dtype=np.uint8)
+    for i in range(max(len(path) for path in paths) + tail):
+        rows = [DOOR] + [pallet(path[i], conf) for path in paths if i < len(path) and path[i] is not None]
+        session.processDetections(frame, np.array(rows, dtype=np.float32), draw=False)
+        clock.now += FRAME_INTERVAL
+    names = {}
+    return [(doc_cat, doc_type, names.setdefault(pallet_id, f"P{len(names)}") if pallet_id is not None else None)
+            for doc_cat, doc_type, pallet_id in events]
+
+def test_stage_in_out():
+    assert runFrames([visit(RACK_SIDE, STAGING)]) == [("Stage", "IN", "P0"), ("Stage", "Out", "P0")]
+
+def test_dock_unload_load():
+    assert runFrames([visit((200, 150), (300, 250))]) == [("Dock", "UOD", "P0"), ("Dock", "LOD", "P0")]
+
+def test_low_confidence_pallet():
+    # detections between MODEL_CONF and TRACK_HIGH_CONF still start tracks
+    assert runFrames([visit(RACK_SIDE, STAGING)], conf=0.5) == [("Stage", "IN", "P0"), ("Stage", "Out", "P0")]
+
+@pytest.mark.parametrize("dx, dy, lag", [(0, 45, 0), (45, 0, 0), (-45, 0, 0), (32, 32, 0), (32, -32, 0), (45, 0, 3)])
+def test_adjacent_pallets(dx, dy, lag):
+    # two pallets 45 px apart, side by side or one behind the other: one IN and one Out each
+    first = visit(RACK_SIDE, STAGING)
+    events = runFrames([first, [None] * lag + offset(first, dx, dy)])
+    assert sorted(events) == [("Stage", "IN", "P0"), ("Stage", "IN", "P1"), ("Stage", "Out", "P0"), ("Stage", "Out", "P1")]
+
+def test_static_pallet_sends_nothing():
+    # a pallet that was already in the staging area never entered it from a side
+    assert runFrames([[STAGING] * 30]) == []
+
+def test_fixed_pallet_keeps_its_gate_between_keyframes():
+    # A staged pallet is hidden for one keyframe of a stride of 3, then an
+    # unrelated pallet shows up 120 px away on the rack side: no Out for it.
+    app_ai.setModelClasses({0: "pallet", 1: "door", 2: "forklift"})
+    clock = FakeClock()
+    events = []
+    session = app_ai.CameraSession("Camera01", clock=clock,
+                                   send_event=lambda doc_cat, doc_type, pallet_id, *rest: events.append(doc_type))
+    frame = np.zeros((app_ai.FRAME_SIZE, app_ai.FRAME_SIZE, 3), dtype=np.uint8)
+    def keyframe(centers, skipped=0):
+        session.framesSinceKeyframe = skipped
+        rows = [DOOR] + [pallet(center) for center in centers]
+        session.processDetections(frame, np.array(rows, dtype=np.float32), draw=False)
+        clock.now += FRAME_INTERVAL * (skipped + 1)
+    for center in [RACK_SIDE] * 3 + walk(RACK_SIDE, STAGING, 8) + [STAGING] * 15:
+        keyframe([center])
+    assert events == ["IN"]
+    keyframe([], skipped=2)
+    keyframe([(STAGING[0] + 120, STAGING[1])], skipped=2)
+    keyframe([STAGING, (STAGING[0] + 120, STAGING[1])], skipped=2)
+    assert events == ["IN"]
+
+def snapshotSession(snapshots, clock, events):
+    app_ai.setModelClasses({0: "pallet", 1: "door", 2: "forklift"})
+    return app_ai.CameraSession("Camera01", clock=clock, snapshots=snapshots,
+                                send_event=lambda doc_cat, doc_type, pallet_id, *rest: events.append((doc_type, pallet_id)))
+
+def feed(session, clock, centers):
+    frame = np.zeros((app_ai.FRAME_SIZE, app_ai.FRAME_SIZE, 3), dtype=np.uint8)
+    for center in centers:
+        session.processDetections(frame, np.array([DOOR, pallet(center)], dtype=np.float32), draw=False)
+        clock.now += FRAME_INTERVAL
+
+@pytest.fixture
+def snapshots(tmp_path):
+    snapshots = app_ai.TrackerSnapshots(str(tmp_path / "tracker_snapshots.db"))
+    snapshots.open()
+    yield snapshots
+    snapshots.close()
+
+def test_restart_resumes_from_snapshot(snapshots):
+    # the staged pallet keeps its uuid across a service restart: no second IN, Out carries the uuid
+    clock = FakeClock()
+    events = []
+    session = snapshotSession(snapshots, clock, events)
+    feed(session, clock, [RACK_SIDE] * 3 + walk(RACK_SIDE, STAGING, 8) + [STAGING] * 15)
+    session.saveSnapshot()
+    clock.now += 5
+    restarted = snapshotSession(snapshots, clock, events)
+    assert restarted.resumeObjects()
+    feed(restarted, clock, [STAGING] * 5 + walk(STAGING, RACK_SIDE, 8) + [RACK_SIDE] * 3)
+    assert [doc_type for doc_type, _ in events] == ["IN", "Out"]
+    assert events[0][1] == events[1][1]
+
+@pytest.mark.parametrize("connections", [0, 1])
+def test_reconnect_keeps_newer_state(snapshots, connections):
+    # The pallet enters after the last snapshot, then the camera reconnects,
+    # with the old socket dropped or not noticed yet: the state in memory wins
+    clock = FakeClock()
+    events = []
+    session = snapshotSession(snapshots, clock, events)
+    feed(session, clock, [RACK_SIDE] + walk(RACK_SIDE, STAGING, 8))
+    assert [doc_type for doc_type, _ in events] == ["IN"]
+    assert snapshots.load("Camera01")[1] < clock.now - 1.0
+    session.connections = connections
+    assert not session.resumeObjects()
+    feed(session, clock, [STAGING] * 15 + walk(STAGING, RACK_SIDE, 8) + [RACK_SIDE] * 3)
+    assert [doc_type for doc_type, _ in events] == ["IN", "Out"]
+    assert events[0][1] == events[1][1]